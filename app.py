@@ -1,22 +1,51 @@
-from flask import Flask, request, render_template, send_file, redirect, url_for, session, flash, jsonify
+from flask import Flask, request, render_template, send_file, redirect, url_for, session, flash, jsonify, Response
 import pandas as pd
+import numpy as np
 from io import BytesIO
 from datetime import datetime, date, timedelta
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from google.oauth2 import service_account
+import google.auth.transport.requests
 from googleapiclient.discovery import build
 import psycopg2
+import psycopg2.extensions
 import time
 import requests
+import requests.adapters
 from bs4 import BeautifulSoup
-from flask import request, render_template_string
-from collections import defaultdict
+from html.parser import HTMLParser
+from collections import defaultdict, OrderedDict
 from sshtunnel import SSHTunnelForwarder
-from typing import List, Tuple, Optional
+from typing import Callable, List, Tuple, Optional
 from calendar import monthrange
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from markupsafe import escape
+from urllib.parse import quote_plus
+import bisect
+import click
+import hashlib
 import json
 import os
+import queue
+import random
+import re
+import shutil
+import tempfile
+import threading
+import weakref
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    import lxml.etree
+    import lxml.html
+except ImportError:
+    lxml = None
 
 
 def rgb_to_hex(rgb):
@@ -94,52 +123,733 @@ def persist_stats_exclusions(user: Optional[str], dimension: str, exclusions: Li
     with open(STATS_EXCLUSIONS_PATH, "w", encoding="utf-8") as f:
         json.dump(store, f)
 
-def get_matching_google_sheet_rows(engine_code):
-    try:
-        SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
-        creds = service_account.Credentials.from_service_account_file('credentials.json', scopes=SCOPES)
+# Engine-code Google Sheet. A background thread mirrors the sheet's values and
+# background colours into memory, so searches never wait on the Sheets API.
+GOOGLE_CREDENTIALS_PATH = os.environ.get("GOOGLE_CREDENTIALS_PATH", "credentials.json")
+GOOGLE_SHEET_ID = os.environ.get("GOOGLE_SHEET_ID", "1iH-70OrINA2jcd6YKszW-N8XpuJDTC9A3oArNWHbEeY")
+GOOGLE_SHEET_RANGE = os.environ.get("GOOGLE_SHEET_RANGE", "Sheet1")
+GOOGLE_SCOPES = [
+    "https://www.googleapis.com/auth/spreadsheets.readonly",
+    "https://www.googleapis.com/auth/drive.metadata.readonly",
+]
+# The sheet's Drive modifiedTime is checked every SHEET_CHANGE_CHECK_INTERVAL
+# seconds and a changed sheet is re-downloaded; a full sync also runs every
+# SHEET_SYNC_INTERVAL seconds in case the modification time is unavailable.
+SHEET_SYNC_INTERVAL = float(os.environ.get("SHEET_SYNC_INTERVAL", "900"))
+SHEET_CHANGE_CHECK_INTERVAL = float(os.environ.get("SHEET_CHANGE_CHECK_INTERVAL", "60"))
+SHEET_INITIAL_SYNC_WAIT = float(os.environ.get("SHEET_INITIAL_SYNC_WAIT", "15"))
+SHEET_SKIPPED_COLUMNS = (17, 18)  # Columns R and S are not shown
+
+
+# Warm-up is off unless GOOGLE_WARMUP=1. When on, each worker starts the sheet
+# mirror as soon as it boots (see gunicorn.conf.py), so the credentials and the
+# mirror thread's Sheets and Drive clients are ready before the first search.
+GOOGLE_WARMUP = os.environ.get("GOOGLE_WARMUP", "0") == "1"
+
+
+class GoogleApiClients:
+    """Process-wide service-account credentials and discovery clients.
+
+    Credentials are read from disk once and their access token is refreshed
+    shortly before it expires, by one thread at a time under its own lock so a
+    slow token endpoint never blocks stats() or threads that already hold a
+    valid token. Building a discovery client parses
+    the API's discovery document, so each thread builds one client per API and
+    keeps it; httplib2 connections are not safe to share between threads.
+    """
 
-        SPREADSHEET_ID = '1iH-70OrINA2jcd6YKszW-N8XpuJDTC9A3oArNWHbEeY'
-        RANGE = 'Sheet1'
+    def __init__(self, credentials_path: str, scopes: List[str]):
+        self.credentials_path = credentials_path
+        self.scopes = scopes
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._pid = None
+        self._credentials = None
+        self._local = threading.local()
+        self._metrics = {"credential_loads": 0, "token_refreshes": 0, "clients_built": 0, "last_error": None}
+
+    def credentials(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Never reuse a parent's clients (and their sockets) after a fork.
+                self._pid = os.getpid()
+                self._credentials = None
+                self._local = threading.local()
+                self._refresh_lock = threading.Lock()
+            if self._credentials is None:
+                self._credentials = service_account.Credentials.from_service_account_file(
+                    self.credentials_path, scopes=self.scopes
+                )
+                self._metrics["credential_loads"] += 1
+            credentials = self._credentials
+            refresh_lock = self._refresh_lock
+        if credentials.valid:
+            return credentials
+        with refresh_lock:
+            # Another thread may have refreshed the token while this one waited.
+            if not credentials.valid:
+                try:
+                    credentials.refresh(google.auth.transport.requests.Request())
+                except Exception as e:
+                    with self._lock:
+                        # Reload from disk next time, in case the key was rotated.
+                        if self._credentials is credentials:
+                            self._credentials = None
+                        self._metrics["last_error"] = str(e)
+                    raise
+                with self._lock:
+                    self._metrics["token_refreshes"] += 1
+        return credentials
+
+    def service(self, api: str, version: str):
+        credentials = self.credentials()
+        services = getattr(self._local, "services", None)
+        if services is None:
+            services = self._local.services = {}
+        if (api, version) not in services:
+            services[(api, version)] = build(api, version, credentials=credentials, cache_discovery=False)
+            with self._lock:
+                self._metrics["clients_built"] += 1
+        return services[(api, version)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            expiry = self._credentials.expiry if self._credentials is not None else None
+            return {
+                "token_expiry": expiry.strftime("%Y-%m-%d %H:%M:%S") if expiry else None,
+                **self._metrics,
+            }
 
-        service = build('sheets', 'v4', credentials=creds)
 
-        values_result = service.spreadsheets().values().get(
-            spreadsheetId=SPREADSHEET_ID, range=RANGE).execute()
-        values = values_result.get('values', [])
+google_clients = GoogleApiClients(GOOGLE_CREDENTIALS_PATH, GOOGLE_SCOPES)
 
-        format_result = service.spreadsheets().get(
-            spreadsheetId=SPREADSHEET_ID,
-            ranges=[RANGE],
-            fields='sheets.data.rowData.values.effectiveFormat.backgroundColor'
-        ).execute()
 
-        row_data = format_result['sheets'][0]['data'][0]['rowData']
+class SheetSnapshot:
+    """One synced copy of the sheet, prepared for lookups.
 
-        headers = values[0]
-        rows = []
+    The row dicts the page shows, hex colours included, are built once per
+    sync, and an n-gram index over every cell narrows an engine-code lookup
+    to the rows that can contain it.
+    """
 
-        for i, row in enumerate(values[1:], start=1):
-            row_dict = {}
-            for j, cell in enumerate(row):
-                if j in (17, 18):  # Skip columns R and S
-                    continue
-                cell_text = cell
-                bg_color = row_data[i]['values'][j].get('effectiveFormat', {}).get('backgroundColor', {})
-                hex_color = rgb_to_hex(bg_color)
-                key = headers[j]
-                row_dict[key] = {'value': cell_text, 'bg': hex_color}
-            if any(engine_code.lower() in str(c).lower() for c in row):
-                rows.append(row_dict)
+    def __init__(self, values: list, row_data: list, modified_time: Optional[str]):
+        self.headers = values[0] if values else []
+        self.modified_time = modified_time
+        self.synced_at = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        body = values[1:]
+        self.rows = len(body)
+        self.row_dicts = [self._row_dict(row, row_data, i) for i, row in enumerate(body, start=1)]
+        # Matching looks at every cell, including the columns that are not shown.
+        cells = [[str(cell).lower() for cell in row] for row in body]
+        self._row_texts = ["\x00".join(row) for row in cells]
+        self._index = NgramIndex(cells)
+
+    def _row_dict(self, row: list, row_data: list, i: int) -> dict:
+        try:
+            formats = row_data[i]['values']
+        except (IndexError, KeyError):
+            formats = []
+        row_dict = {}
+        for j, cell in enumerate(row):
+            if j in SHEET_SKIPPED_COLUMNS or j >= len(self.headers):
+                continue
+            fmt = formats[j] if j < len(formats) else {}
+            row_dict[self.headers[j]] = {'value': cell, 'bg': rgb_to_hex(fmt.get('effectiveFormat', {}).get('backgroundColor', {}))}
+        return row_dict
 
-        return rows
+    def match(self, engine_code: str) -> List[dict]:
+        needle = engine_code.lower()
+        return [self.row_dicts[i] for i in self._index.candidates(needle) if needle in self._row_texts[i]]
 
+
+def fetch_sheet_modified_time() -> Optional[str]:
+    drive = google_clients.service('drive', 'v3')
+    meta = drive.files().get(fileId=GOOGLE_SHEET_ID, fields='modifiedTime', supportsAllDrives=True).execute()
+    return meta.get('modifiedTime')
+
+
+def fetch_sheet_snapshot() -> SheetSnapshot:
+    try:
+        modified_time = fetch_sheet_modified_time()
     except Exception as e:
-        print("Error accessing Google Sheets:", e)
+        print("Could not read the Google Sheet modification time:", e)
+        modified_time = None
+
+    service = google_clients.service('sheets', 'v4')
+    values_result = service.spreadsheets().values().get(
+        spreadsheetId=GOOGLE_SHEET_ID, range=GOOGLE_SHEET_RANGE).execute()
+    format_result = service.spreadsheets().get(
+        spreadsheetId=GOOGLE_SHEET_ID,
+        ranges=[GOOGLE_SHEET_RANGE],
+        fields='sheets.data.rowData.values.effectiveFormat.backgroundColor'
+    ).execute()
+    row_data = format_result['sheets'][0]['data'][0].get('rowData', [])
+    return SheetSnapshot(values_result.get('values', []), row_data, modified_time)
+
+
+class SheetMirror:
+    """Keeps the latest good SheetSnapshot in memory and refreshes it in the background.
+
+    The sync thread starts on first use in each process. A failed sync keeps
+    the previous snapshot; only the very first lookup waits, for at most
+    ``initial_wait`` seconds, for the first sync to finish.
+    """
+
+    def __init__(self, fetch, fetch_modified_time, sync_interval: float, check_interval: float, initial_wait: float):
+        self._fetch = fetch
+        self._fetch_modified_time = fetch_modified_time
+        self.sync_interval = sync_interval
+        self.check_interval = check_interval
+        self.initial_wait = initial_wait
+        self._snapshot = None
+        self._first_sync = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._last_sync_started = None
+        self._modified_time_error = None
+        self._metrics = {"syncs": 0, "failures": 0, "skipped_unchanged": 0, "last_error": None, "last_sync_seconds": None}
+
+    def snapshot(self) -> Optional[SheetSnapshot]:
+        self.start()
+        if self._snapshot is None:
+            self._first_sync.wait(self.initial_wait)
+        return self._snapshot
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._first_sync = threading.Event()
+            threading.Thread(target=self._run, name="sheet-mirror", daemon=True).start()
+
+    def _run(self):
+        self.sync()
+        while True:
+            time.sleep(self.check_interval)
+            if self._snapshot is not None and time.monotonic() - self._last_sync_started < self.sync_interval:
+                try:
+                    modified_time = self._fetch_modified_time()
+                except Exception as e:
+                    # Without Drive access this fails every check; only the interval sync applies.
+                    if str(e) != self._modified_time_error:
+                        print("Could not read the Google Sheet modification time:", e)
+                    self._modified_time_error = str(e)
+                    continue
+                if modified_time is None or modified_time == self._snapshot.modified_time:
+                    with self._lock:
+                        self._metrics["skipped_unchanged"] += 1
+                    continue
+            self.sync()
+
+    def sync(self):
+        self._last_sync_started = time.monotonic()
+        try:
+            snapshot = self._fetch()
+        except Exception as e:
+            with self._lock:
+                self._metrics["failures"] += 1
+                self._metrics["last_error"] = str(e)
+            print("Error accessing Google Sheets, keeping the last good copy:", e)
+        else:
+            self._snapshot = snapshot
+            with self._lock:
+                self._metrics["syncs"] += 1
+                self._metrics["last_sync_seconds"] = round(time.monotonic() - self._last_sync_started, 3)
+        finally:
+            self._first_sync.set()
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        with self._lock:
+            return {
+                "rows": snapshot.rows if snapshot else None,
+                "synced_at": snapshot.synced_at if snapshot else None,
+                "modified_time": snapshot.modified_time if snapshot else None,
+                **self._metrics,
+            }
+
+
+sheet_mirror = SheetMirror(
+    fetch_sheet_snapshot, fetch_sheet_modified_time, SHEET_SYNC_INTERVAL, SHEET_CHANGE_CHECK_INTERVAL, SHEET_INITIAL_SYNC_WAIT
+)
+
+
+def warm_up_google_sheet():
+    """Start the sheet mirror without waiting for its first sync.
+
+    Discovery clients are kept per thread, so they are built by the mirror
+    thread that uses them rather than by a short-lived warm-up thread.
+    """
+    sheet_mirror.start()
+
+
+def get_matching_google_sheet_rows(engine_code):
+    snapshot = sheet_mirror.snapshot()
+    if snapshot is None:
         return []
+    return snapshot.match(engine_code)
+
+def opportunity_metrics(frame: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Potential_Profit, Sales_Speed and Opportunity_Score in float64.
+
+    The stored columns are float32 to keep the frame compact. Float32 rounding
+    merges and reorders near-ties and is off by cents on large values, so
+    ranking, thresholds and the rows shown use these full-precision values.
+    """
+    potential_profit = (frame['Backorders'].to_numpy(dtype=float) + frame['Not Found 180 days'].to_numpy(dtype=float)) \
+        * frame['B Price'].to_numpy(dtype=float)
+    sales_speed = frame['Parts Sold All'].to_numpy(dtype=float) / (frame['Parts in Stock'].to_numpy(dtype=float) + 1)
+    return potential_profit, sales_speed, potential_profit * sales_speed
+
+
+def opportunity_scores(frame: pd.DataFrame) -> np.ndarray:
+    return opportunity_metrics(frame)[2]
+
+
+def add_opportunity_metrics(frame: pd.DataFrame) -> pd.DataFrame:
+    """Add the per-row opportunity metrics once per dataset load, as compact float32 columns."""
+    potential_profit, sales_speed, scores = opportunity_metrics(frame)
+    frame['Potential_Profit'] = potential_profit.astype('float32')
+    frame['Sales_Speed'] = sales_speed.astype('float32')
+    frame['Opportunity_Score'] = scores.astype('float32')
+    return frame
+
+
+class FleetIndex:
+    """Row positions of the WebFleet frame grouped by lowercased model.
+
+    Each model's rows are stored ranked by (Backorders, Opportunity_Score)
+    descending, the order the search results are shown in, so a model + year
+    lookup is a year-range mask over that model's rows and the top N is a slice.
+    All models share three flat arrays (``ARRAYS``) with a [lo, hi) range per
+    model, so the index can be saved next to the frame and memory-mapped.
+
+    IC Description codes are taken from the frame and only the distinct
+    descriptions are lowercased, so the engine-code rule only touches the
+    descriptions of the candidate rows.
+    """
+
+    ARRAYS = ('positions', 'start_years', 'end_years')
+
+    def __init__(self, frame: pd.DataFrame, arrays: Optional[dict] = None, keys: Optional[List[str]] = None):
+        if arrays is None:
+            arrays, keys = self._build(frame)
+        self.arrays = arrays
+        self.keys = keys
+        bounds = arrays['bounds']
+        self._buckets = {key: (int(bounds[i]), int(bounds[i + 1])) for i, key in enumerate(keys)}
+
+        description_codes, descriptions = category_codes(frame['IC Description'])
+        self._description_codes = description_codes
+        self._descriptions_lower = pd.Series(np.asarray(descriptions).astype(str), dtype=object).str.lower()
+        self._mentions_engine_code = self._descriptions_lower.str.contains('engine code', regex=False).to_numpy()
+
+    @classmethod
+    def _build(cls, frame: pd.DataFrame) -> Tuple[dict, List[str]]:
+        backorders = frame['Backorders'].to_numpy(dtype=float)
+        scores = opportunity_scores(frame)
+
+        # Lowercase each distinct model once, then map rows onto the lowercased keys.
+        model_codes, models = category_codes(frame['Model'])
+        key_codes, keys = pd.factorize(pd.Series(np.asarray(models), dtype=object).str.lower())
+        codes = np.full(len(model_codes), -1, dtype=np.intp)
+        known = model_codes >= 0
+        codes[known] = key_codes[model_codes[known]]
+
+        positions = np.flatnonzero(codes >= 0)
+        codes = codes[positions]
+        # lexsort is stable and puts NaN last, matching sort_values(ascending=False).
+        order = np.lexsort((-scores[positions], -backorders[positions], codes))
+        positions = positions[order].astype(np.int32)
+        codes = codes[order]
+
+        starts = np.flatnonzero(np.r_[True, np.diff(codes) != 0]) if len(codes) else np.empty(0, dtype=np.intp)
+        arrays = {
+            'positions': positions,
+            'start_years': frame['IC Start Year'].to_numpy()[positions],
+            'end_years': frame['IC End Year'].to_numpy()[positions],
+            'bounds': np.r_[starts, len(codes)].astype(np.int64),
+        }
+        return arrays, [str(keys[code]) for code in codes[starts]]
+
+    def lookup(self, model: str, year: int) -> np.ndarray:
+        """Positions of rows for ``model`` whose IC year range covers ``year``, best first."""
+        bucket = self._buckets.get(model.lower())
+        if bucket is None:
+            return np.empty(0, dtype=np.int32)
+        lo, hi = bucket
+        mask = (self.arrays['start_years'][lo:hi] <= year) & (self.arrays['end_years'][lo:hi] >= year)
+        return self.arrays['positions'][lo:hi][mask]
+
+    def engine_code_mask(self, positions: np.ndarray, engine_code: str) -> np.ndarray:
+        """Rows whose description never mentions an engine code pass; the rest must contain it."""
+        codes = self._description_codes[positions]
+        mentions = np.zeros(len(positions), dtype=bool)
+        known = codes >= 0
+        mentions[known] = self._mentions_engine_code[codes[known]]
+        if not mentions.any():
+            return np.ones(len(positions), dtype=bool)
+
+        candidates = np.unique(codes[mentions])
+        contains = self._descriptions_lower.iloc[candidates].str.contains(engine_code.lower(), regex=False)
+        return ~mentions | np.isin(codes, candidates[contains.to_numpy()])
+
+
+def category_codes(series: pd.Series) -> Tuple[np.ndarray, pd.Index]:
+    """Codes and distinct values of a column, reusing a categorical's own codes without copying."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), series.cat.categories
+    codes, uniques = pd.factorize(series)
+    return codes, pd.Index(uniques)
+
+
+class NgramIndex:
+    """Ids of the documents containing each gram of 1 to ``size`` characters.
+
+    A document is a list of lowercased fields; grams never span two fields.
+    Lookups return candidates in id order, to be confirmed with a substring test.
+    """
+
+    def __init__(self, documents, size: int = 3):
+        self.size = size
+        postings = defaultdict(list)
+        for doc_id, fields in enumerate(documents):
+            grams = set()
+            for text in fields:
+                for length in range(1, size + 1):
+                    for start in range(len(text) - length + 1):
+                        grams.add(text[start:start + length])
+            for gram in grams:
+                postings[gram].append(doc_id)
+        self._postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+    def _query_postings(self, query: str) -> List[np.ndarray]:
+        length = min(len(query), self.size)
+        postings = []
+        for start in range(len(query) - length + 1):
+            ids = self._postings.get(query[start:start + length])
+            if ids is None:
+                return []
+            postings.append(ids)
+        return sorted(postings, key=len)
+
+    def rarest(self, query: str) -> np.ndarray:
+        """Documents sharing the query's rarest gram; cheap when the caller stops early."""
+        postings = self._query_postings(query) if query else []
+        return postings[0] if postings else np.empty(0, dtype=np.int32)
+
+    def candidates(self, query: str) -> np.ndarray:
+        """Documents containing every gram of the query."""
+        postings = self._query_postings(query) if query else []
+        if not postings:
+            return np.empty(0, dtype=np.int32)
+        result = postings[0]
+        for ids in postings[1:]:
+            if not len(result):
+                break
+            result = np.intersect1d(result, ids, assume_unique=True)
+        return result
+
+
+AUTOCOMPLETE_LIMIT = int(os.environ.get("AUTOCOMPLETE_LIMIT", "20"))
+
+
+class ModelAutocomplete:
+    """Model names prepared for /autocomplete_model.
+
+    Names are kept sorted by their lowercased form so prefix matches are a
+    bisect, and so are the tails of each name starting at a later word, which
+    makes word-start matches a bisect too. Plain substring matches only check
+    the names that share the query's rarest n-gram and stop once the result is full.
+    """
+
+    def __init__(self, models: pd.Series):
+        if isinstance(models.dtype, pd.CategoricalDtype):
+            names = models.cat.categories[np.unique(models.cat.codes[models.cat.codes >= 0])]
+        else:
+            names = models.dropna().unique()
+        self._names = sorted({str(name) for name in names}, key=lambda name: (name.lower(), name))
+        self._lowered = [name.lower() for name in self._names]
+
+        word_tails = []
+        for position, name in enumerate(self._lowered):
+            for start in range(1, len(name)):
+                if name[start].isalnum() and not name[start - 1].isalnum():
+                    word_tails.append((name[start:], position))
+        word_tails.sort()
+        self._word_tails = [tail for tail, _ in word_tails]
+        self._word_positions = [position for _, position in word_tails]
+        self._grams = NgramIndex([name] for name in self._lowered)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def search(self, query: str, limit: int = AUTOCOMPLETE_LIMIT) -> List[str]:
+        """Ranked matches: exact, then prefix, then word start, then any substring."""
+        query = query.strip().lower()
+        if not query or limit <= 0:
+            return []
+
+        # Sorting on the lowercased name puts an exact match first among the prefixes.
+        lo, hi = self._prefix_range(self._lowered, query)
+        results = list(range(lo, min(hi, lo + limit)))
+        seen = set(results)
+        if len(results) < limit:
+            lo, hi = self._prefix_range(self._word_tails, query)
+            for index in range(lo, hi):
+                position = self._word_positions[index]
+                if position not in seen and not self._lowered[position].startswith(query):
+                    seen.add(position)
+                    results.append(position)
+                    if len(results) == limit:
+                        break
+        if len(results) < limit:
+            for position in self._grams.rarest(query):
+                position = int(position)
+                if position not in seen and query in self._lowered[position]:
+                    seen.add(position)
+                    results.append(position)
+                    if len(results) == limit:
+                        break
+        return [self._names[position] for position in results]
+
+    @staticmethod
+    def _prefix_range(keys: List[str], query: str) -> Tuple[int, int]:
+        lo = bisect.bisect_left(keys, query)
+        return lo, bisect.bisect_left(keys, query + '\uffff', lo)
+
+
+# WebFleet dataset. Each load produces an immutable snapshot; requests take the
+# current snapshot once and keep using it, so a reload swapping in a new one
+# never changes data under a search that is already running.
+FLEET_CSV_PATH = os.environ.get("FLEET_CSV_PATH", "WebFleet.csv")
+FLEET_RELOAD_INTERVAL = float(os.environ.get("FLEET_RELOAD_INTERVAL", "30"))
+FLEET_CACHE_DIR = os.environ.get("FLEET_CACHE_DIR")
+FLEET_CACHE_VERSION = 3
+
+# Explicit dtypes for the fleet CSV. Text columns become categoricals, counts
+# and years become int32 (float32 when a column has gaps) and prices stay float64.
+FLEET_CATEGORY_COLUMNS = ('Model', 'Part', 'IC Description')
+FLEET_COUNT_COLUMNS = (
+    'IC Start Year', 'IC End Year', 'Parts in Stock', 'Backorders', 'Parts Sold All', 'Not Found 180 days'
+)
+FLEET_PRICE_COLUMNS = ('B Price',)
+
+
+class FleetSnapshot:
+    def __init__(
+        self, frame: pd.DataFrame, index: FleetIndex, source_stamp: Tuple[int, int], load_seconds: float, source: str
+    ):
+        self.frame = frame
+        self.index = index
+        self.source_stamp = source_stamp
+        self.load_seconds = load_seconds
+        self.source = source
+        self.loaded_at = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        self.rows = len(frame)
+        self.autocomplete = ModelAutocomplete(frame['Model'])
+
+
+def fleet_source_stamp(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def read_fleet_csv(path: str) -> pd.DataFrame:
+    frame = pd.read_csv(path, dtype={column: 'category' for column in FLEET_CATEGORY_COLUMNS})
+    for column in frame.columns:
+        if column in FLEET_COUNT_COLUMNS:
+            values = pd.to_numeric(frame[column], errors='coerce')
+            whole = values.notna().all() and (values % 1 == 0).all()
+            frame[column] = values.astype('int32' if whole else 'float32')
+        elif column in FLEET_PRICE_COLUMNS:
+            frame[column] = pd.to_numeric(frame[column], errors='coerce').astype('float64')
+        elif frame[column].dtype == object:
+            frame[column] = frame[column].astype('category')
+    return add_opportunity_metrics(frame)
+
+
+def fleet_cache_path(path: str, source_stamp: Tuple[int, int]) -> str:
+    cache_dir = FLEET_CACHE_DIR or os.path.join(os.path.dirname(os.path.abspath(path)), '.fleet_cache')
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, f"{name}-v{FLEET_CACHE_VERSION}-{source_stamp[0]}-{source_stamp[1]}")
+
+
+def write_fleet_cache(frame: pd.DataFrame, index: FleetIndex, cache_path: str):
+    """Store a prepared fleet frame as one .npy file per column (codes + categories for categoricals),
+    plus the arrays of its FleetIndex."""
+    parent = os.path.dirname(cache_path)
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=parent, prefix='.building-')
+    try:
+        columns = []
+        for position, column in enumerate(frame.columns):
+            series = frame[column]
+            entry = {'name': column, 'file': f"{position}.npy"}
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                entry['categories'] = series.cat.categories.tolist()
+                values = series.cat.codes.to_numpy()
+            else:
+                values = series.to_numpy()
+            np.save(os.path.join(staging, entry['file']), values, allow_pickle=False)
+            columns.append(entry)
+        index_files = {}
+        for name, values in index.arrays.items():
+            index_files[name] = f"index-{name}.npy"
+            np.save(os.path.join(staging, index_files[name]), values, allow_pickle=False)
+        meta = {'rows': len(frame), 'columns': columns, 'index': {'keys': index.keys, 'files': index_files}}
+        with open(os.path.join(staging, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        try:
+            os.rename(staging, cache_path)
+        except OSError:
+            # Another worker finished the same cache first.
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    # Drop caches built from older versions of the same CSV, or by an older cache format.
+    name = os.path.basename(cache_path).rsplit('-', 3)[0]
+    pattern = re.compile(re.escape(name) + r"-v\d+-\d+-\d+")
+    for entry in os.listdir(parent):
+        stale = os.path.join(parent, entry)
+        if pattern.fullmatch(entry) and stale != cache_path:
+            shutil.rmtree(stale, ignore_errors=True)
+
+
+def read_fleet_cache(cache_path: str) -> Optional[Tuple[pd.DataFrame, FleetIndex]]:
+    """Open a fleet cache with every array memory-mapped read-only.
+
+    The mapped pages live in the OS page cache, so every worker (and every
+    reload of an unchanged file) shares one copy of the data instead of
+    holding its own.
+    """
+    meta_path = os.path.join(cache_path, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    columns = {}
+    for entry in meta['columns']:
+        values = np.load(os.path.join(cache_path, entry['file']), mmap_mode='r', allow_pickle=False)
+        if 'categories' in entry:
+            values = pd.Categorical.from_codes(values, categories=pd.Index(entry['categories']))
+        columns[entry['name']] = values
+    # copy=False keeps one block per column, each a view onto its mapped file.
+    frame = pd.DataFrame(columns, copy=False)
+    arrays = {
+        name: np.load(os.path.join(cache_path, file), mmap_mode='r', allow_pickle=False)
+        for name, file in meta['index']['files'].items()
+    }
+    return frame, FleetIndex(frame, arrays, meta['index']['keys'])
+
+
+def load_fleet_snapshot(path: str) -> FleetSnapshot:
+    started = time.perf_counter()
+    source_stamp = fleet_source_stamp(path)
+    cache_path = fleet_cache_path(path, source_stamp)
+    source = 'cache'
+    try:
+        cached = read_fleet_cache(cache_path)
+    except Exception as exc:
+        print(f"Ignoring unreadable fleet cache {cache_path}: {exc}")
+        cached = None
+    if cached is None:
+        source = 'csv'
+        frame = read_fleet_csv(path)
+        index = FleetIndex(frame)
+        try:
+            write_fleet_cache(frame, index, cache_path)
+            # Serve from the mapped copy so this process shares it with the others too.
+            cached = read_fleet_cache(cache_path)
+        except Exception as exc:
+            print(f"Could not write fleet cache {cache_path}: {exc}")
+    if cached is not None:
+        frame, index = cached
+    return FleetSnapshot(frame, index, source_stamp, time.perf_counter() - started, source)
+
+
+class FleetDataStore:
+    """Serves the current WebFleet snapshot and reloads it in the background when the CSV changes."""
+
+    def __init__(self, path: str, check_interval: float):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot = load_fleet_snapshot(path)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._metrics = {"reloads": 0, "failures": 0, "last_error": None}
+        print(
+            f"Loaded {path} from {self._snapshot.source}: "
+            f"{self._snapshot.rows} rows in {self._snapshot.load_seconds:.2f}s"
+        )
+
+    def snapshot(self) -> FleetSnapshot:
+        self._ensure_watcher()
+        return self._snapshot
+
+    def _ensure_watcher(self):
+        if self._pid == os.getpid() or self.check_interval <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._watch, name="fleet-reloader", daemon=True).start()
+
+    def _watch(self):
+        pending_stamp = None
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                stamp = fleet_source_stamp(self.path)
+            except OSError:
+                continue
+            if stamp == self._snapshot.source_stamp:
+                pending_stamp = None
+                continue
+            # Only load once the file has stopped changing between two checks,
+            # so a copy that is still being written is never picked up.
+            if stamp != pending_stamp:
+                pending_stamp = stamp
+                continue
+            self.reload()
+
+    def reload(self):
+        try:
+            snapshot = load_fleet_snapshot(self.path)
+        except Exception as exc:
+            with self._lock:
+                self._metrics["failures"] += 1
+                self._metrics["last_error"] = str(exc)
+            print(f"Reloading {self.path} failed, keeping the current data: {exc}")
+            return
+        self._snapshot = snapshot
+        with self._lock:
+            self._metrics["reloads"] += 1
+        print(f"Reloaded {self.path} from {snapshot.source}: {snapshot.rows} rows in {snapshot.load_seconds:.2f}s")
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        with self._lock:
+            return {
+                "path": self.path,
+                "rows": snapshot.rows,
+                "models": len(snapshot.autocomplete),
+                "loaded_from": snapshot.source,
+                "load_seconds": round(snapshot.load_seconds, 3),
+                "loaded_at": snapshot.loaded_at,
+                "source_mtime": datetime.utcfromtimestamp(snapshot.source_stamp[0] / 1e9).strftime("%Y-%m-%d %H:%M:%S"),
+                **self._metrics,
+            }
 
-file_path = 'WebFleet.csv'
-df = pd.read_csv(file_path)
+
+fleet_store = FleetDataStore(FLEET_CSV_PATH, FLEET_RELOAD_INTERVAL)
 
 app = Flask(__name__)
 app.secret_key = 'your_super_secret_key_here'
@@ -206,16 +916,143 @@ def require_login():
 def autocomplete_model():
     query = request.args.get('query', '')
     if query:
-        filtered_models = df['Model'].dropna().unique()
-        matches = [model for model in filtered_models if query.lower() in model.lower()]
-        return {'models': matches}
+        return {'models': fleet_store.snapshot().autocomplete.search(query)}
     return {'models': []}
 
+INDEX_SEARCH_WORKERS = int(os.environ.get("INDEX_SEARCH_WORKERS", "8"))
+INDEX_SOURCE_TIMEOUTS = {
+    "fleet": float(os.environ.get("INDEX_FLEET_TIMEOUT", "10")),
+    "sheet": float(os.environ.get("INDEX_SHEET_TIMEOUT", "5")),
+    "ebay": float(os.environ.get("INDEX_EBAY_TIMEOUT", "4")),
+}
+INDEX_SOURCE_LABELS = {"fleet": "WebFleet parts", "sheet": "Google Sheet matches", "ebay": "eBay sold prices"}
+# Fetch the eBay bands alongside a search so the modals open instantly. The
+# bands are seeded all or nothing: ebay_client.search() waits for every band,
+# so if any band misses the timeout none are seeded, and the modals ask
+# /ebay_parts, which finds the bands the background fetch has since cached.
+INDEX_PREFETCH_EBAY = os.environ.get("INDEX_PREFETCH_EBAY", "0") == "1"
+
+EXCLUSION_KEYWORDS = [
+    "ENGINE", "TRANS/GEARBOX", "TURBOCHARGER", "SUPERCHARGER", "THROTTLE_BODY",
+    "ALTERNATOR", "STARTER", "A/C_COMPRESSOR", "Cylinder_head",
+    "FUEL_INJECTOR", "Injector_rail", "COIL/COIL_PACK",
+    "Injector_pump", "OIL_PAN/SUMP", "EGR_VALVE/COOLER"
+]
+PARTS_COLUMNS = [
+    'Part', 'IC Start Year', 'IC End Year', 'IC Description', 'B Price', 'Parts in Stock', 'Backorders',
+    'Parts Sold All', 'Not Found 180 days', 'Potential_Profit', 'Sales_Speed', 'Opportunity_Score',
+]
+
+
+class SourceFanOut:
+    """Runs the independent data sources behind one page concurrently.
+
+    Each source gets its own timeout, counted from when the batch starts, so
+    the page waits for the slowest source that answers in time rather than the
+    sum of all of them. A source that times out keeps running in the pool; its
+    result is dropped for this request. The pool is created lazily per process.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._metrics = {"runs": 0, "timeouts": {}, "last_seconds": {}}
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="fan-out")
+            self._pid = os.getpid()
+
+    def run(self, sources: dict, timeouts: dict) -> Tuple[dict, List[str]]:
+        """Results keyed like ``sources`` (name -> callable), and the names that timed out.
+
+        An exception raised by a source propagates, as it would have inline.
+        """
+        self._ensure_started()
+        started = time.monotonic()
+        futures = {name: self._executor.submit(self._timed, name, load) for name, load in sources.items()}
+        results = {}
+        timed_out = []
+        for name, future in futures.items():
+            try:
+                results[name] = future.result(timeout=max(0.0, started + timeouts[name] - time.monotonic()))
+            except FutureTimeout:
+                timed_out.append(name)
+                print(f"{INDEX_SOURCE_LABELS.get(name, name)} timed out after {timeouts[name]:.1f}s; rendering without it.")
+        with self._lock:
+            self._metrics["runs"] += 1
+            for name in timed_out:
+                self._metrics["timeouts"][name] = self._metrics["timeouts"].get(name, 0) + 1
+        return results, timed_out
+
+    def _timed(self, name: str, load):
+        started = time.perf_counter()
+        try:
+            return load()
+        finally:
+            with self._lock:
+                self._metrics["last_seconds"][name] = round(time.perf_counter() - started, 3)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "runs": self._metrics["runs"],
+                "timeouts": dict(self._metrics["timeouts"]),
+                "last_seconds": dict(self._metrics["last_seconds"]),
+            }
+
+
+index_fan_out = SourceFanOut(INDEX_SEARCH_WORKERS)
+
+
+def search_fleet_parts(
+    model: str,
+    year: int,
+    engine_code: str,
+    min_price: Optional[float],
+    min_opportunity: Optional[float],
+    exclude_major_parts: bool,
+):
+    """The top 50 matching parts as a DataFrame, or None when nothing matches."""
+    # Initial filtering
+    fleet = fleet_store.snapshot()
+    positions = fleet.index.lookup(model, year)
+    if engine_code:
+        positions = positions[fleet.index.engine_code_mask(positions, engine_code)]
+    filtered = fleet.frame.iloc[positions]
+
+    # 🚨 NEW: exclusion list logic
+    if exclude_major_parts:
+        pattern = '|'.join(rf'\b{kw}\b' for kw in EXCLUSION_KEYWORDS)
+        filtered = filtered[~filtered['Part'].str.contains(pattern, case=False, na=False, regex=True)]
+
+    # Proceed with opportunity calculations if there's something left
+    if filtered.empty:
+        return None
+    if min_price is not None:
+        filtered = filtered[filtered['B Price'] >= min_price]
+    if min_opportunity is not None:
+        filtered = filtered[opportunity_scores(filtered) >= min_opportunity]
+    # Rows come back from the index already ranked, so the top 50 is a slice.
+    top = filtered[PARTS_COLUMNS].head(50).copy()
+    # Shown and exported in full precision rather than the stored float32.
+    top['Potential_Profit'], top['Sales_Speed'], top['Opportunity_Score'] = opportunity_metrics(top)
+    return top
+
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     global last_search_result, search_details
     parts = None
     google_sheet_matches = []
+    ebay_bands = None
+    timed_out = []
     if request.method == 'POST':
         model = request.form['model']
         year = int(request.form['year'])
@@ -223,55 +1060,48 @@ def index():
         min_price = request.form.get('min_price')
         min_opportunity = request.form.get('min_opportunity')
         action = request.form.get('action')
-
-        # Initial filtering
-        filtered = df[
-            (df['Model'].str.lower() == model.lower()) &
-            (df['IC Start Year'] <= year) &
-            (df['IC End Year'] >= year)
-        ]
-
-        if engine_code:
-            def custom_filter(row):
-                description = str(row['IC Description'])
-                if 'engine code' in description.lower():
-                    return engine_code.lower() in description.lower()
-                return True
-            filtered = filtered[filtered.apply(custom_filter, axis=1)]
-
-        # 🚨 NEW: exclusion list logic
-        if action == 'search_excluding':
-            exclusion_keywords = [
-                "ENGINE", "TRANS/GEARBOX", "TURBOCHARGER", "SUPERCHARGER", "THROTTLE_BODY",
-                "ALTERNATOR", "STARTER", "A/C_COMPRESSOR", "Cylinder_head",
-                "FUEL_INJECTOR", "Injector_rail", "COIL/COIL_PACK",
-                "Injector_pump", "OIL_PAN/SUMP", "EGR_VALVE/COOLER"
-            ]
-            pattern = '|'.join(rf'\b{kw}\b' for kw in exclusion_keywords)
-            filtered = filtered[~filtered['Part'].str.contains(pattern, case=False, na=False, regex=True)]
-
-        # Proceed with opportunity calculations if there's something left
-        if not filtered.empty:
-            filtered['Potential_Profit'] = (filtered['Backorders'] + filtered['Not Found 180 days']) * filtered['B Price']
-            filtered['Sales_Speed'] = filtered['Parts Sold All'] / (filtered['Parts in Stock'] + 1)
-            filtered['Opportunity_Score'] = filtered['Potential_Profit'] * filtered['Sales_Speed']
-
-            if min_price:
-                filtered = filtered[filtered['B Price'] >= float(min_price)]
-            if min_opportunity:
-                filtered = filtered[filtered['Opportunity_Score'] >= float(min_opportunity)]
-
-            parts = filtered[['Part', 'IC Start Year', 'IC End Year', 'IC Description', 'B Price', 'Parts in Stock', 'Backorders',
-                              'Parts Sold All', 'Not Found 180 days', 'Potential_Profit', 'Sales_Speed', 'Opportunity_Score']]
-            parts = parts.sort_values(by=['Backorders', 'Opportunity_Score'], ascending=False).head(50)
-            last_search_result = parts
-            search_details = {'model': model, 'year': year, 'engine_code': engine_code}
-            parts = parts.to_dict('records')
-
+        # The heading and the export always belong to this search, even when
+        # the fleet source times out or fails.
+        last_search_result = None
+        search_details = {'model': model, 'year': year, 'engine_code': engine_code}
+
+        # The sources are independent, so they run side by side; the page
+        # renders whatever answered within each source's timeout.
+        sources = {
+            "fleet": lambda: search_fleet_parts(
+                model,
+                year,
+                engine_code,
+                float(min_price) if min_price else None,
+                float(min_opportunity) if min_opportunity else None,
+                action == 'search_excluding',
+            ),
+        }
         if engine_code:
-            google_sheet_matches = get_matching_google_sheet_rows(engine_code)
+            sources["sheet"] = lambda: get_matching_google_sheet_rows(engine_code)
+        if INDEX_PREFETCH_EBAY:
+            sources["ebay"] = lambda: ebay_client.search(model, str(year))
+        results, timed_out = index_fan_out.run(sources, INDEX_SOURCE_TIMEOUTS)
+
+        found = results.get("fleet")
+        if found is not None:
+            last_search_result = found
+            parts = found.to_dict('records')
+        google_sheet_matches = results.get("sheet") or []
+        if "ebay" in results:
+            ebay_bands = {
+                "key": f"{model}|{year}",
+                "bands": {band: render_ebay_band(band, result) for band, result in results["ebay"].items()},
+            }
 
-    return render_template('index.html', parts=parts, search_details=search_details, google_sheet_matches=google_sheet_matches)
+    return render_template(
+        'index.html',
+        parts=parts,
+        search_details=search_details,
+        google_sheet_matches=google_sheet_matches,
+        ebay_bands=ebay_bands,
+        timed_out=[INDEX_SOURCE_LABELS[name] for name in timed_out],
+    )
 
 @app.route('/download')
 def download():
@@ -284,240 +1114,718 @@ def download():
         return send_file(output, download_name="parts_opportunity.xlsx", as_attachment=True)
     return "No data to download", 400
 
-@app.route('/ebay_small_parts')
-def ebay_small_parts():
-    import time
-    model = request.args.get('model', '').strip()
-    year = request.args.get('year', '').strip()
-    if not model or not year:
-        return "Model and year are required.", 400
+class ResultCache:
+    """Bounded LRU cache with per-entry TTLs and single-flight loading.
 
-    query = f"{model} {year}"
-    search_url = (
-        "https://www.ebay.co.uk/sch/131090/i.html?_nkw=" + query.replace(" ", "+") +
-        "&LH_ItemCondition=4&rt=nc&_sop=12&_udhi=50&LH_Complete=1&LH_Sold=1"
-    )
-    print("\U0001F50D eBay search URL:", search_url)
-
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-                      "(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Accept-Encoding": "gzip, deflate, br",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-        "Connection": "keep-alive",
-    }
+    Concurrent misses for the same key wait for one loader instead of all
+    running it, so N clients polling the same data cost one query. With a
+    ``stale_ttl``, an entry past its TTL is still served for that much longer
+    while a single background load refreshes it (stale-while-revalidate).
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+        self._metrics = {
+            "hits": 0, "misses": 0, "coalesced": 0, "stale_hits": 0,
+            "refreshes": 0, "refresh_failures": 0, "expirations": 0, "evictions": 0,
+        }
+
+    def _lookup(self, key):
+        """(value, is_stale) for a usable entry, or None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, fresh_until, expires_at = entry
+        now = time.monotonic()
+        if expires_at is not None and now >= expires_at:
+            del self._entries[key]
+            self._metrics["expirations"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return value, fresh_until is not None and now >= fresh_until
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return self._lookup(key) is not None
+
+    def get(self, key, default=None):
+        with self._lock:
+            found = self._lookup(key)
+            hit = found is not None and not found[1]
+            self._metrics["hits" if hit else "misses"] += 1
+            return found[0] if hit else default
+
+    def put(self, key, value, ttl: Optional[float] = None, stale_ttl: float = 0):
+        fresh_until = None if ttl is None else time.monotonic() + ttl
+        expires_at = None if fresh_until is None else fresh_until + stale_ttl
+        with self._lock:
+            self._entries[key] = (value, fresh_until, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._metrics["evictions"] += 1
+
+    def get_or_load(self, key, loader, ttl: Optional[float] = None, stale_ttl: float = 0):
+        with self._lock:
+            found = self._lookup(key)
+            if found is not None and not found[1]:
+                self._metrics["hits"] += 1
+                return found[0]
+            pending = self._loading.get(key)
+            if pending is None:
+                pending = self._loading[key] = threading.Event()
+                owner = True
+            else:
+                owner = False
+            if found is not None:
+                self._metrics["stale_hits"] += 1
+
+        if found is not None:
+            # Serve the stale value now; at most one refresh runs per key.
+            if owner:
+                threading.Thread(
+                    target=self._refresh, args=(key, loader, ttl, stale_ttl, pending), name="cache-refresh", daemon=True
+                ).start()
+            return found[0]
+
+        if not owner:
+            pending.wait()
+            with self._lock:
+                found = self._lookup(key)
+                if found is not None:
+                    self._metrics["coalesced"] += 1
+                    return found[0]
+            # The loader we waited on failed; fall through and load ourselves.
+            return self.get_or_load(key, loader, ttl, stale_ttl)
 
-    response = None
-    for attempt in range(3):
         try:
-            response = requests.get(search_url, headers=headers, timeout=10)
-            response.raise_for_status()
-            break
-        except Exception as e:
-            print(f"eBay fetch attempt {attempt + 1} failed: {e}")
-            time.sleep(2)
-    else:
-        return render_template_string("<p><strong>Failed to fetch data from eBay after 3 attempts.</strong></p>")
+            with self._lock:
+                self._metrics["misses"] += 1
+            value = loader()
+            self.put(key, value, ttl, stale_ttl)
+            return value
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            pending.set()
+
+    def _refresh(self, key, loader, ttl, stale_ttl, pending):
+        try:
+            self.put(key, loader(), ttl, stale_ttl)
+            with self._lock:
+                self._metrics["refreshes"] += 1
+        except Exception as exc:
+            with self._lock:
+                self._metrics["refresh_failures"] += 1
+            print(f"Background refresh of {key!r} failed, keeping the stale value: {exc}")
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            pending.set()
 
-    soup = BeautifulSoup(response.text, 'html.parser')
-    items = soup.select('.s-item')
-    print(f"Found {len(items)} items in eBay search Small.")
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
 
-    part_list = []
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries, **self._metrics}
 
-    for item in items:
-        title_tag = item.select_one('.s-item__title')
-        price_tag = item.select_one('.s-item__price')
-        link_tag = item.select_one('.s-item__link')
 
-        if not title_tag or not price_tag or not link_tag:
-            continue
+# Outbound HTTP. Calls to third-party sites go through a RetryPolicy and a
+# CircuitBreaker so a throttling or failing upstream costs a bounded amount of
+# time per request, and nothing at all while the breaker is open.
+class UpstreamError(Exception):
+    pass
 
-        title = title_tag.get_text(strip=True)
-        price_text = price_tag.get_text(strip=True).replace("£", "").split()[0]
-        link = link_tag.get("href")
 
-        try:
-            price = float(price_text)
-        except ValueError:
-            continue
+class CircuitOpenError(UpstreamError):
+    pass
 
-        if price <= 50:
-            part_list.append({
-                "title": title,
-                "price": price,
-                "link": link
-            })
 
-    if not part_list:
-        return "<p>No results found under £50.</p>"
+class CircuitBreaker:
+    """Fails calls fast after ``failure_threshold`` consecutive upstream errors.
 
-    part_list.sort(key=lambda x: x["price"], reverse=True)
+    Once ``reset_timeout`` seconds have passed, a single trial call is let
+    through (half-open): success closes the breaker, failure reopens it.
+    Failures reported with the same ``scope`` (one logical search, with all
+    its retries and concurrent requests) count as one consecutive failure.
+    """
 
-    html = "<table class='table table-striped'><thead><tr><th>Title</th><th>Price</th><th>Link</th></tr></thead><tbody>"
-    for part in part_list:
-        html += f"<tr><td>{part['title']}</td><td>£{part['price']:.2f}</td><td><a href='{part['link']}' target='_blank'>View</a></td></tr>"
-    html += "</tbody></table>"
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._failed_scopes = set()
+        self._metrics = {"successes": 0, "failures": 0, "rejected": 0, "times_opened": 0}
+
+    def before_call(self):
+        with self._lock:
+            if self._state == "open":
+                remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+                if remaining > 0:
+                    self._metrics["rejected"] += 1
+                    raise CircuitOpenError(f"{self.name} is unavailable right now, try again in {remaining:.0f}s.")
+                self._state = "half_open"
+            if self._state == "half_open":
+                if self._trial_running:
+                    self._metrics["rejected"] += 1
+                    raise CircuitOpenError(f"{self.name} is unavailable right now, try again shortly.")
+                self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self._metrics["successes"] += 1
+            self._consecutive_failures = 0
+            self._failed_scopes.clear()
+            self._state = "closed"
+            self._trial_running = False
+
+    def record_neutral(self):
+        """A response that says nothing about upstream health: only frees the half-open trial."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self, scope=None):
+        with self._lock:
+            self._metrics["failures"] += 1
+            if scope is None or scope not in self._failed_scopes:
+                self._consecutive_failures += 1
+                if scope is not None:
+                    self._failed_scopes.add(scope)
+            self._trial_running = False
+            if self._state == "half_open" or self._consecutive_failures >= self.failure_threshold:
+                if self._state != "open":
+                    self._metrics["times_opened"] += 1
+                    print(f"{self.name} circuit opened after {self._consecutive_failures} consecutive failures")
+                self._state = "open"
+                self._opened_at = time.monotonic()
+                self._failed_scopes.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            retry_in = None
+            if self._state == "open":
+                retry_in = round(max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at)), 1)
+            return {
+                "state": self._state,
+                "consecutive_failures": self._consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "retry_in_seconds": retry_in,
+                **self._metrics,
+            }
 
-    return render_template_string(html)
 
-@app.route('/ebay_medium_parts')
-def ebay_medium_parts():
-    import time
-    model = request.args.get('model', '').strip()
-    year = request.args.get('year', '').strip()
-    if not model or not year:
-        return "Model and year are required.", 400
+class RetryPolicy:
+    """Exponential backoff with full jitter, bounded by an overall deadline per call."""
 
-    query = f"{model} {year}"
-    search_url = (
-        "https://www.ebay.co.uk/sch/131090/i.html?_nkw=" + query.replace(" ", "+") +
-        "&LH_ItemCondition=4&rt=nc&_sop=12&_udlo=50&_udhi=500&LH_Complete=1&LH_Sold=1"
-        
-    )
-    print("\U0001F50D eBay search URL:", search_url)
-
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-                      "(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Accept-Encoding": "gzip, deflate, br",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-        "Connection": "keep-alive",
-    }
+    def __init__(self, attempts: int, base_delay: float, max_delay: float, deadline: float):
+        if attempts < 1:
+            raise ValueError(f"RetryPolicy needs at least 1 attempt, got {attempts}")
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
 
-    response = None
-    for attempt in range(3):
+
+def retry_after_seconds(response) -> float:
+    try:
+        return max(0.0, float(response.headers.get("Retry-After", 0)))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def fetch_with_policy(
+    session: requests.Session,
+    url: str,
+    timeout: float,
+    policy: RetryPolicy,
+    breaker: CircuitBreaker,
+    scope: Optional[object] = None,
+) -> requests.Response:
+    """GET ``url``, retrying connection errors, timeouts, 429 and 5xx within the policy's deadline.
+
+    Other 4xx responses are returned to the caller's raise_for_status() straight away.
+    A 403 is how eBay answers a blocked or throttled client, so it counts as a
+    breaker failure (without a retry); any other 4xx leaves the breaker as it was.
+    All attempts report failures under ``scope`` (by default one per call),
+    so retries never count as extra consecutive failures.
+    """
+    scope = scope if scope is not None else object()
+    deadline = time.monotonic() + policy.deadline
+    last_error = None
+    for attempt in range(policy.attempts):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        breaker.before_call()
+        delay = policy.backoff(attempt)
         try:
-            response = requests.get(search_url, headers=headers, timeout=10)
-            response.raise_for_status()
+            response = session.get(url, timeout=min(timeout, remaining))
+            if response.status_code == 429 or response.status_code >= 500:
+                delay = max(delay, retry_after_seconds(response))
+                response.raise_for_status()
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+            breaker.record_failure(scope)
+            last_error = e
+            print(f"{breaker.name} fetch attempt {attempt + 1} failed: {e}")
+            if attempt + 1 < policy.attempts and time.monotonic() + delay < deadline:
+                time.sleep(delay)
+                continue
             break
-        except Exception as e:
-            print(f"eBay fetch attempt {attempt + 1} failed: {e}")
-            time.sleep(2)
-    else:
-        return render_template_string("<p><strong>Failed to fetch data from eBay after 3 attempts.</strong></p>")
+        except Exception:
+            breaker.record_failure(scope)
+            raise
+        if response.status_code == 403:
+            breaker.record_failure(scope)
+        elif 400 <= response.status_code < 500:
+            breaker.record_neutral()
+        else:
+            breaker.record_success()
+        return response
+    if time.monotonic() >= deadline:
+        raise UpstreamError(f"{breaker.name} did not respond within {policy.deadline:.0f}s.") from last_error
+    raise UpstreamError(f"Failed to fetch data from {breaker.name} after {attempt + 1} attempts.") from last_error
+
+
+# eBay sold listings. Each price band is its own sold-listings search; the bands
+# are fetched concurrently over one keep-alive session and each page is parsed once.
+EBAY_SEARCH_URL = os.environ.get("EBAY_SEARCH_URL", "https://www.ebay.co.uk/sch/131090/i.html")
+EBAY_MAX_WORKERS = int(os.environ.get("EBAY_MAX_WORKERS", "6"))
+# Sold listings barely move within an hour. After EBAY_CACHE_TTL a band is still
+# served for EBAY_CACHE_STALE_TTL more seconds while one background fetch renews it.
+EBAY_CACHE_MAX_ENTRIES = int(os.environ.get("EBAY_CACHE_MAX_ENTRIES", "512"))
+EBAY_CACHE_TTL = float(os.environ.get("EBAY_CACHE_TTL", "3600"))
+EBAY_CACHE_STALE_TTL = float(os.environ.get("EBAY_CACHE_STALE_TTL", "82800"))
+# Outbound policy: up to EBAY_FETCH_ATTEMPTS tries per page with jittered
+# exponential backoff, all within EBAY_DEADLINE seconds; after
+# EBAY_BREAKER_THRESHOLD consecutive upstream errors every fetch fails fast
+# for EBAY_BREAKER_RESET seconds.
+EBAY_FETCH_ATTEMPTS = int(os.environ.get("EBAY_FETCH_ATTEMPTS", "3"))
+EBAY_BACKOFF_BASE = float(os.environ.get("EBAY_BACKOFF_BASE", "0.5"))
+EBAY_BACKOFF_MAX = float(os.environ.get("EBAY_BACKOFF_MAX", "4"))
+EBAY_DEADLINE = float(os.environ.get("EBAY_DEADLINE", "25"))
+EBAY_BREAKER_THRESHOLD = int(os.environ.get("EBAY_BREAKER_THRESHOLD", "5"))
+EBAY_BREAKER_RESET = float(os.environ.get("EBAY_BREAKER_RESET", "60"))
+EBAY_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                  "(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept-Encoding": "gzip, deflate, br",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Connection": "keep-alive",
+}
+EBAY_PRICE_BANDS = {
+    "small": {
+        "label": "Small",
+        "filter": "&_udhi=50",
+        "accepts": lambda price: price <= 50,
+        "timeout": 10,
+        "empty": "No results found under £50.",
+    },
+    "medium": {
+        "label": "Medium",
+        "filter": "&_udlo=50&_udhi=500",
+        "accepts": lambda price: 50 < price <= 500,
+        "timeout": 10,
+        "empty": "No results found between £50 and £500.",
+    },
+    "large": {
+        "label": "Large",
+        "filter": "&_udlo=500&_udhi=5000",
+        "accepts": lambda price: price >= 500,
+        "timeout": 20,
+        "empty": "No results found over £500.",
+    },
+}
 
-    soup = BeautifulSoup(response.text, 'html.parser')
-    items = soup.select('.s-item')
-    print(f"Found {len(items)} items in eBay search Medium.")
 
-    part_list = []
+class EbayFetchError(Exception):
+    pass
+
+
+# Result page parsing. Every backend yields, per ".s-item", the fields it found:
+# the text of the first title and price elements and the href of the first link.
+# C-backed parsers are used when installed; "stream" is a single pass over the
+# stdlib tokenizer that never builds a tree, and "bs4" is the original path.
+EBAY_PARSER = os.environ.get("EBAY_PARSER", "auto")
+EBAY_ITEM_FIELDS = {"s-item__title": "title", "s-item__price": "price", "s-item__link": "link"}
+
+
+def iter_ebay_fields_bs4(html: str):
+    soup = BeautifulSoup(html, 'html.parser')
+    for item in soup.select('.s-item'):
+        fields = {}
+        for css_class, name in EBAY_ITEM_FIELDS.items():
+            tag = item.select_one('.' + css_class)
+            if tag is not None:
+                fields[name] = tag.get("href") if name == "link" else tag.get_text(strip=True)
+        yield fields
+
+
+def iter_ebay_fields_selectolax(html: str):
+    for item in LexborHTMLParser(html).css('.s-item'):
+        fields = {}
+        for css_class, name in EBAY_ITEM_FIELDS.items():
+            node = item.css_first('.' + css_class)
+            if node is not None:
+                fields[name] = node.attributes.get("href") if name == "link" else node.text(separator='', strip=True)
+        yield fields
+
+
+def iter_ebay_fields_lxml(html: str):
+    if not html.strip():
+        return
+    root = lxml.html.fromstring(html)
+    for item in root.xpath('//*[contains(concat(" ", normalize-space(@class), " "), " s-item ")]'):
+        fields = {}
+        # One walk over the item's elements, taking the first match of each field.
+        for element in item.iterdescendants(lxml.etree.Element):
+            for token in (element.get("class") or "").split():
+                name = EBAY_ITEM_FIELDS.get(token)
+                if name is None or name in fields:
+                    continue
+                if name == "link":
+                    fields[name] = element.get("href")
+                else:
+                    fields[name] = "".join(text.strip() for text in element.itertext())
+            if len(fields) == len(EBAY_ITEM_FIELDS):
+                break
+        yield fields
 
-    for item in items:
-        title_tag = item.select_one('.s-item__title')
-        price_tag = item.select_one('.s-item__price')
-        link_tag = item.select_one('.s-item__link')
 
-        if not title_tag or not price_tag or not link_tag:
-            continue
+class EbayListingStream(HTMLParser):
+    """Collects listing fields in one pass over the tokenizer, without building a tree."""
 
-        title = title_tag.get_text(strip=True)
-        price_text = price_tag.get_text(strip=True).replace("£", "").split()[0]
-        link = link_tag.get("href")
+    VOID_TAGS = frozenset(
+        ('area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'source', 'track', 'wbr')
+    )
 
+    def __init__(self):
+        super().__init__()
+        self.items = []
+        self._open_tags = []
+        self._item_depth = None
+        self._fields = None
+        self._capturing = {}
+
+    def handle_starttag(self, tag, attrs):
+        classes = next((value.split() for key, value in attrs if key == 'class' and value), ())
+        void = tag in self.VOID_TAGS
+        if not void:
+            self._open_tags.append(tag)
+        depth = len(self._open_tags)
+        if self._item_depth is None:
+            if 's-item' in classes and not void:
+                self._item_depth = depth
+                self._fields = {}
+            return
+        for token in classes:
+            name = EBAY_ITEM_FIELDS.get(token)
+            if name is None or name in self._fields or name in self._capturing:
+                continue
+            if name == "link":
+                self._fields[name] = dict(attrs).get("href")
+            elif void:
+                self._fields[name] = ""
+            else:
+                self._capturing[name] = (depth, [])
+
+    def handle_data(self, data):
+        text = data.strip() if self._capturing else None
+        if text:
+            for _, parts in self._capturing.values():
+                parts.append(text)
+
+    def handle_endtag(self, tag):
+        if tag not in self._open_tags:
+            return
+        # Unclosed children end with their parent, as in a tree builder.
+        while self._open_tags:
+            depth = len(self._open_tags)
+            if self._open_tags.pop() == tag:
+                self._element_closed(depth)
+                break
+            self._element_closed(depth)
+
+    def _element_closed(self, depth: int):
+        for name, (start, parts) in list(self._capturing.items()):
+            if start == depth:
+                self._fields[name] = "".join(parts)
+                del self._capturing[name]
+        if depth == self._item_depth:
+            self.items.append(self._fields)
+            self._item_depth = None
+            self._fields = None
+
+    def close(self):
+        super().close()
+        while self._open_tags:
+            self._element_closed(len(self._open_tags))
+            self._open_tags.pop()
+
+
+def iter_ebay_fields_stream(html: str):
+    parser = EbayListingStream()
+    parser.feed(html)
+    parser.close()
+    return parser.items
+
+
+EBAY_PARSERS = {"stream": iter_ebay_fields_stream, "bs4": iter_ebay_fields_bs4}
+if lxml is not None:
+    EBAY_PARSERS["lxml"] = iter_ebay_fields_lxml
+if LexborHTMLParser is not None:
+    EBAY_PARSERS["selectolax"] = iter_ebay_fields_selectolax
+
+
+def ebay_parser_backend(name: str = EBAY_PARSER) -> str:
+    if name in EBAY_PARSERS:
+        return name
+    if name != "auto":
+        print(f"eBay parser '{name}' is not available, choosing automatically")
+    return next(backend for backend in ("selectolax", "lxml", "stream") if backend in EBAY_PARSERS)
+
+
+EBAY_PARSER_BACKEND = ebay_parser_backend()
+
+
+def parse_ebay_listings(html: str, backend: Optional[str] = None) -> List[dict]:
+    """Title, price and link of every priced listing on a sold-listings results page."""
+    listings = []
+    for fields in EBAY_PARSERS[backend or EBAY_PARSER_BACKEND](html):
+        if len(fields) < len(EBAY_ITEM_FIELDS):
+            continue
+        price_text = fields["price"].replace("£", "").split()
         try:
-            price = float(price_text)
-        except ValueError:
+            price = float(price_text[0])
+        except (IndexError, ValueError):
             continue
+        listings.append({"title": fields["title"], "price": price, "link": fields["link"]})
+    return listings
+
 
-        if price > 50 and price <= 500:
-            part_list.append({
-                "title": title,
-                "price": price,
-                "link": link
-            })
+class EbayClient:
+    """Fetches the sold-listing price bands for a model and year.
+
+    The HTTP session and the worker pool are created lazily per process, so a
+    gunicorn worker forked from a preloaded master never shares sockets with it.
+    """
 
-    if not part_list:
-        return "<p>No results found between £50 and £500.</p>"
+    def __init__(
+        self, search_url: str, max_workers: int, cache: ResultCache, retry_policy: RetryPolicy, breaker: CircuitBreaker
+    ):
+        self.search_url = search_url
+        self.max_workers = max_workers
+        self.cache = cache
+        self.retry_policy = retry_policy
+        self.breaker = breaker
+        self._lock = threading.Lock()
+        self._pid = None
+        self._session = None
+        self._executor = None
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update(EBAY_HEADERS)
+            self._session = session
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ebay")
+            self._pid = os.getpid()
+
+    def band_url(self, model: str, year: str, band: str) -> str:
+        query = quote_plus(f"{model} {year}")
+        return (
+            f"{self.search_url}?_nkw={query}&LH_ItemCondition=4&rt=nc&_sop=12"
+            f"{EBAY_PRICE_BANDS[band]['filter']}&LH_Complete=1&LH_Sold=1"
+        )
 
-    part_list.sort(key=lambda x: x["price"], reverse=True)
+    def fetch(self, url: str, timeout: float, scope: Optional[object] = None) -> str:
+        self._ensure_started()
+        try:
+            response = fetch_with_policy(self._session, url, timeout, self.retry_policy, self.breaker, scope)
+            response.raise_for_status()
+        except UpstreamError as e:
+            raise EbayFetchError(str(e)) from e
+        except requests.RequestException as e:
+            raise EbayFetchError(f"eBay request failed: {e}") from e
+        return response.text
+
+    def search_band(self, model: str, year: str, band: str, scope: Optional[object] = None) -> List[dict]:
+        """Listings in one price band, most expensive first."""
+        settings = EBAY_PRICE_BANDS[band]
+        url = self.band_url(model, year, band)
+        print("\U0001F50D eBay search URL:", url)
+        listings = parse_ebay_listings(self.fetch(url, settings["timeout"], scope))
+        print(f"Found {len(listings)} items in eBay search {settings['label']}.")
+        parts = [listing for listing in listings if settings["accepts"](listing["price"])]
+        parts.sort(key=lambda x: x["price"], reverse=True)
+        return parts
+
+    @staticmethod
+    def cache_key(model: str, year: str, band: str) -> Tuple[str, str]:
+        # eBay matches case-insensitively, so "ford  focus" and "Ford Focus" share an entry.
+        return " ".join(f"{model} {year}".lower().split()), band
+
+    def cached_band(self, model: str, year: str, band: str, scope: Optional[object] = None) -> List[dict]:
+        return self.cache.get_or_load(
+            self.cache_key(model, year, band),
+            lambda: self.search_band(model, year, band, scope),
+            EBAY_CACHE_TTL,
+            EBAY_CACHE_STALE_TTL,
+        )
 
+    def search(self, model: str, year: str, bands=tuple(EBAY_PRICE_BANDS)) -> dict:
+        """Each requested band mapped to its parts, or to the EbayFetchError it hit.
+
+        Cached bands are answered inline; the rest are fetched concurrently.
+        Failures are not cached, so the next search tries eBay again. The
+        bands of one search count as a single failure towards the breaker.
+        """
+        self._ensure_started()
+        scope = object()
+        pending = {}
+        results = {}
+        for band in bands:
+            if self.cache_key(model, year, band) in self.cache:
+                pending[band] = None
+            else:
+                pending[band] = self._executor.submit(self.cached_band, model, year, band, scope)
+        for band, future in pending.items():
+            try:
+                results[band] = self.cached_band(model, year, band, scope) if future is None else future.result()
+            except EbayFetchError as e:
+                results[band] = e
+        return results
+
+
+ebay_cache = ResultCache(EBAY_CACHE_MAX_ENTRIES)
+ebay_breaker = CircuitBreaker("eBay", EBAY_BREAKER_THRESHOLD, EBAY_BREAKER_RESET)
+ebay_client = EbayClient(
+    EBAY_SEARCH_URL,
+    EBAY_MAX_WORKERS,
+    ebay_cache,
+    RetryPolicy(EBAY_FETCH_ATTEMPTS, EBAY_BACKOFF_BASE, EBAY_BACKOFF_MAX, EBAY_DEADLINE),
+    ebay_breaker,
+)
+
+
+def render_ebay_band(band: str, result) -> str:
+    if isinstance(result, EbayFetchError):
+        return f"<p><strong>{escape(str(result))}</strong></p>"
+    if not result:
+        return f"<p>{EBAY_PRICE_BANDS[band]['empty']}</p>"
     html = "<table class='table table-striped'><thead><tr><th>Title</th><th>Price</th><th>Link</th></tr></thead><tbody>"
-    for part in part_list:
-        html += f"<tr><td>{part['title']}</td><td>£{part['price']:.2f}</td><td><a href='{part['link']}' target='_blank'>View</a></td></tr>"
+    for part in result:
+        html += (
+            f"<tr><td>{escape(part['title'])}</td><td>£{part['price']:.2f}</td>"
+            f"<td><a href='{escape(part['link'])}' target='_blank'>View</a></td></tr>"
+        )
     html += "</tbody></table>"
+    return html
 
-    return render_template_string(html)
 
-@app.route('/ebay_large_parts')
-def ebay_large_parts():
-    import time
+def ebay_search_args() -> Optional[Tuple[str, str]]:
     model = request.args.get('model', '').strip()
     year = request.args.get('year', '').strip()
     if not model or not year:
-        return "Model and year are required.", 400
-
-    query = f"{model} {year}"
-    search_url = (
-        "https://www.ebay.co.uk/sch/131090/i.html?_nkw=" + query.replace(" ", "+") +
-        "&LH_ItemCondition=4&rt=nc&_sop=12&_udlo=500&_udhi=5000&LH_Complete=1&LH_Sold=1"
-    )
-    print("\U0001F50D eBay search URL:", search_url)
-
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-                      "(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        "Accept-Language": "en-US,en;q=0.9",
-        "Accept-Encoding": "gzip, deflate, br",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-        "Connection": "keep-alive",
-    }
-
-    response = None
-    for attempt in range(3):
-        try:
-            response = requests.get(search_url, headers=headers, timeout=20)
-            response.raise_for_status()
-            break
-        except Exception as e:
-            print(f"eBay fetch attempt {attempt + 1} failed: {e}")
-            time.sleep(2)
-    else:
-        return render_template_string("<p><strong>Failed to fetch data from eBay after 3 attempts.</strong></p>")
+        return None
+    return model, year
 
-    soup = BeautifulSoup(response.text, 'html.parser')
-    items = soup.select('.s-item')
-    print(f"Found {len(items)} items in eBay search Large.")
 
-    part_list = []
-
-    for item in items:
-        title_tag = item.select_one('.s-item__title')
-        price_tag = item.select_one('.s-item__price')
-        link_tag = item.select_one('.s-item__link')
+@app.route('/ebay_parts')
+def ebay_parts():
+    """All price bands for one search, as rendered HTML per band."""
+    args = ebay_search_args()
+    if args is None:
+        return "Model and year are required.", 400
+    results = ebay_client.search(*args)
+    return jsonify({band: render_ebay_band(band, result) for band, result in results.items()})
 
-        if not title_tag or not price_tag or not link_tag:
-            continue
 
-        title = title_tag.get_text(strip=True)
-        price_text = price_tag.get_text(strip=True).replace("£", "").split()[0]
-        link = link_tag.get("href")
+def ebay_band_view(band: str):
+    args = ebay_search_args()
+    if args is None:
+        return "Model and year are required.", 400
+    return render_ebay_band(band, ebay_client.search(*args, bands=(band,))[band])
 
-        try:
-            price = float(price_text)
-        except ValueError:
-            continue
 
-        if price >= 500:
-            part_list.append({
-                "title": title,
-                "price": price,
-                "link": link
-            })
+@app.route('/ebay_small_parts')
+def ebay_small_parts():
+    return ebay_band_view("small")
 
-    if not part_list:
-        return "<p>No results found over £500.</p>"
 
-    part_list.sort(key=lambda x: x["price"], reverse=True)
+@app.route('/ebay_medium_parts')
+def ebay_medium_parts():
+    return ebay_band_view("medium")
 
-    html = "<table class='table table-striped'><thead><tr><th>Title</th><th>Price</th><th>Link</th></tr></thead><tbody>"
-    for part in part_list:
-        html += f"<tr><td>{part['title']}</td><td>£{part['price']:.2f}</td><td><a href='{part['link']}' target='_blank'>View</a></td></tr>"
-    html += "</tbody></table>"
 
-    return render_template_string(html)
+@app.route('/ebay_large_parts')
+def ebay_large_parts():
+    return ebay_band_view("large")
+
+
+@app.cli.command("save-ebay-pages")
+@click.argument("model")
+@click.argument("year")
+@click.argument("directory", type=click.Path(file_okay=False))
+def save_ebay_pages(model, year, directory):
+    """Save the raw result page of every price band, for bench-ebay-parsers."""
+    os.makedirs(directory, exist_ok=True)
+    for band in EBAY_PRICE_BANDS:
+        html = ebay_client.fetch(ebay_client.band_url(model, year, band), EBAY_PRICE_BANDS[band]["timeout"])
+        path = os.path.join(directory, f"{'_'.join(f'{model} {year}'.lower().split())}-{band}.html")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(html)
+        print(f"Saved {path} ({len(html) // 1024} KiB)")
+
+
+@app.cli.command("bench-ebay-parsers")
+@click.argument("pages", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("--repeat", default=10, show_default=True, help="Parses of each page per backend.")
+def bench_ebay_parsers(pages, repeat):
+    """Time every available parser backend over saved eBay result pages.
+
+    Each backend's listings are also checked against the original bs4 path.
+    """
+    documents = []
+    for path in pages:
+        with open(path, "r", encoding="utf-8") as f:
+            documents.append(f.read())
+    expected = [parse_ebay_listings(html, "bs4") for html in documents]
+
+    print(f"{len(documents)} pages, {sum(len(listings) for listings in expected)} listings, {repeat} runs each")
+    baseline = None
+    for backend in ["bs4"] + sorted(name for name in EBAY_PARSERS if name != "bs4"):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            results = [parse_ebay_listings(html, backend) for html in documents]
+        per_page = (time.perf_counter() - started) / (repeat * len(documents)) * 1000
+        baseline = baseline or per_page
+        mismatches = sum(result != reference for result, reference in zip(results, expected))
+        marker = " (active)" if backend == EBAY_PARSER_BACKEND else ""
+        print(
+            f"{backend:<11} {per_page:8.2f} ms/page  {baseline / per_page:5.1f}x  "
+            f"{mismatches} pages differing from bs4{marker}"
+        )
 
 # PostgreSQL connection helper
 # configure SSH and DB
@@ -534,32 +1842,371 @@ DB_USER = "postgres"
 DB_PASS = ""
 IMAGE_BASE_URL = "http://192.168.10.23/pinproHostedImages/"
 
-# keep tunnel global so it persists
-tunnel = None
-
-def init_ssh_tunnel():
-    global tunnel
-    if tunnel is None or not tunnel.is_active:
-        tunnel = SSHTunnelForwarder(
-            (SSH_HOST, SSH_PORT),
-            ssh_username=SSH_USER,
-            ssh_password=SSH_PASSWORD,
-            remote_bind_address=("127.0.0.1", 5432)
-        )
-        tunnel.start()
-        print(f"SSH tunnel established at 127.0.0.1:{tunnel.local_bind_port}")
+# SSH tunnel supervision. Each worker keeps one tunnel alive in the background
+# so requests never pay for the SSH handshake themselves.
+SSH_KEEPALIVE_SECONDS = float(os.environ.get("SSH_KEEPALIVE_SECONDS", "15"))
+SSH_TUNNEL_CHECK_INTERVAL = float(os.environ.get("SSH_TUNNEL_CHECK_INTERVAL", "5"))
+SSH_TUNNEL_WAIT_SECONDS = float(os.environ.get("SSH_TUNNEL_WAIT_SECONDS", "10"))
+SSH_RECONNECT_MAX_BACKOFF = float(os.environ.get("SSH_RECONNECT_MAX_BACKOFF", "60"))
+
+
+def build_ssh_forwarder():
+    return SSHTunnelForwarder(
+        (SSH_HOST, SSH_PORT),
+        ssh_username=SSH_USER,
+        ssh_password=SSH_PASSWORD,
+        remote_bind_address=("127.0.0.1", DB_PORT),
+        set_keepalive=SSH_KEEPALIVE_SECONDS,
+    )
+
+
+class TunnelUnavailable(Exception):
+    pass
+
+
+class SSHTunnelSupervisor:
+    """Keeps one SSH tunnel per worker process alive, rebuilding it in the background.
+
+    ``forwarder_factory`` returns an object with the SSHTunnelForwarder surface
+    used here (start, stop, is_active, local_bind_port), so a fake forwarder or
+    a local sshd can stand in for the real server.
+    """
+
+    def __init__(self, forwarder_factory, check_interval: float, wait_timeout: float, max_backoff: float):
+        self._factory = forwarder_factory
+        self.check_interval = check_interval
+        self.wait_timeout = wait_timeout
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._forwarder = None
+        self._thread = None
+        self._pid = None
+        self.generation = 0
+        self._metrics = {
+            "connects": 0,
+            "failures": 0,
+            "last_error": None,
+            "connected_at": None,
+        }
+
+    def start(self):
+        """Start the background supervisor once per process."""
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            # A forked worker inherits the parent's forwarder object but not its
+            # transport threads, so it always builds a tunnel of its own.
+            self._pid = os.getpid()
+            self._forwarder = None
+            self._ready.clear()
+            self._stop_event = threading.Event()
+            self._thread = threading.Thread(
+                target=self._run, args=(self._stop_event,), name="ssh-tunnel-supervisor", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stop_event.set()
+            self._ready.clear()
+            self._wake.set()
+            forwarder, self._forwarder = self._forwarder, None
+            self._thread = None
+            self._pid = None
+        if forwarder is not None:
+            self._stop_quietly(forwarder)
+
+    def _is_active(self) -> bool:
+        forwarder = self._forwarder
+        return forwarder is not None and forwarder.is_active
+
+    def _run(self, stop_event: threading.Event):
+        backoff = 1.0
+        while not stop_event.is_set():
+            if self._is_active():
+                backoff = 1.0
+                self._wake.wait(self.check_interval)
+                self._wake.clear()
+                continue
+
+            self._ready.clear()
+            try:
+                self._reconnect(stop_event)
+                backoff = 1.0
+            except Exception as exc:
+                with self._lock:
+                    self._metrics["failures"] += 1
+                    self._metrics["last_error"] = str(exc)
+                print(f"SSH tunnel connect failed: {exc}; retrying in {backoff:.0f}s")
+                self._wake.wait(backoff)
+                self._wake.clear()
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def _reconnect(self, stop_event: threading.Event):
+        with self._rebuild_lock:
+            with self._lock:
+                previous, self._forwarder = self._forwarder, None
+            if previous is not None:
+                self._stop_quietly(previous)
+
+            forwarder = self._factory()
+            try:
+                forwarder.start()
+            except Exception:
+                # A half-started forwarder can still hold a transport and threads.
+                self._stop_quietly(forwarder)
+                raise
+            with self._lock:
+                if stop_event.is_set():
+                    self._stop_quietly(forwarder)
+                    return
+                self._forwarder = forwarder
+                self.generation += 1
+                self._metrics["connects"] += 1
+                self._metrics["connected_at"] = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+                self._ready.set()
+        print(f"SSH tunnel established at 127.0.0.1:{forwarder.local_bind_port}")
+
+    @staticmethod
+    def _stop_quietly(forwarder):
+        try:
+            forwarder.stop()
+        except Exception:
+            pass
+
+    def endpoint(self, timeout: Optional[float] = None) -> Tuple[int, int]:
+        """Return (local port, tunnel generation), waiting briefly for a healthy tunnel."""
+        self.start()
+        deadline = time.monotonic() + (self.wait_timeout if timeout is None else timeout)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._ready.wait(remaining):
+                raise TunnelUnavailable("SSH tunnel is not available")
+            with self._lock:
+                forwarder = self._forwarder
+                if forwarder is not None and forwarder.is_active:
+                    return forwarder.local_bind_port, self.generation
+                # The tunnel dropped since the last check; let the supervisor rebuild it.
+                self._ready.clear()
+                self._wake.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pid": self._pid,
+                "active": self._is_active(),
+                "generation": self.generation,
+                **self._metrics,
+            }
+
+
+tunnel_supervisor = SSHTunnelSupervisor(
+    build_ssh_forwarder, SSH_TUNNEL_CHECK_INTERVAL, SSH_TUNNEL_WAIT_SECONDS, SSH_RECONNECT_MAX_BACKOFF
+)
+
+
+class TunnelConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that remembers which tunnel it was opened through."""
+
+    tunnel_generation = 0
+
 
 def get_db_connection():
-    init_ssh_tunnel()
+    port, generation = tunnel_supervisor.endpoint()
     conn = psycopg2.connect(
         host="127.0.0.1",
-        port=tunnel.local_bind_port,
+        port=port,
         database=DB_NAME,
         user=DB_USER,
-        password=DB_PASS
+        password=DB_PASS,
+        connection_factory=TunnelConnection,
     )
+    conn.tunnel_generation = generation
     return conn
 
+# Connection pool settings. Every gunicorn worker is its own process with its own
+# pool, so the per-worker size is the overall connection budget split across workers.
+DB_CONNECTION_BUDGET = int(os.environ.get("DB_CONNECTION_BUDGET", "20"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+DB_POOL_HEALTHCHECK_AFTER = float(os.environ.get("DB_POOL_HEALTHCHECK_AFTER", "30"))
+
+
+def default_pool_size() -> int:
+    if os.environ.get("DB_POOL_MAX"):
+        return max(1, int(os.environ["DB_POOL_MAX"]))
+    workers = max(1, int(os.environ.get("WEB_CONCURRENCY", "1")))
+    return max(2, DB_CONNECTION_BUDGET // workers)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of PostgreSQL connections for the current process."""
+
+    def __init__(self, connect, max_size: int, timeout: float, healthcheck_after: float, is_stale=None):
+        self._connect = connect
+        self._is_stale = is_stale or (lambda conn: False)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.healthcheck_after = healthcheck_after
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # Connections inherited from a parent process share its sockets, so a
+        # forked worker starts with an empty pool instead of reusing them.
+        self._pid = os.getpid()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._idle = []
+        self._in_use = 0
+        self._metrics = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_seconds": 0.0,
+            "timeouts": 0,
+            "connections_opened": 0,
+            "reconnects": 0,
+            "discarded": 0,
+        }
+
+    def _check_process(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+
+    def _count(self, key: str, amount=1):
+        with self._lock:
+            self._metrics[key] += amount
+
+    def acquire(self):
+        self._check_process()
+        if not self._slots.acquire(blocking=False):
+            self._count("waits")
+            started = time.monotonic()
+            if not self._slots.acquire(timeout=self.timeout):
+                self._count("timeouts")
+                raise PoolTimeout(f"No database connection became available within {self.timeout:g}s")
+            self._count("wait_seconds", time.monotonic() - started)
+
+        try:
+            conn = self._checkout_idle()
+            if conn is None:
+                conn = self._connect()
+                self._count("connections_opened")
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._metrics["checkouts"] += 1
+            self._in_use += 1
+        return conn
+
+    def _checkout_idle(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                conn, released_at = self._idle.pop()
+            if self._is_healthy(conn, released_at):
+                return conn
+            self._close_quietly(conn)
+            self._count("reconnects")
+
+    def _is_healthy(self, conn, released_at: float) -> bool:
+        if conn.closed or self._is_stale(conn):
+            return False
+        if time.monotonic() - released_at < self.healthcheck_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def release(self, conn, discard: bool = False):
+        try:
+            if not discard and not conn.closed:
+                try:
+                    if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+            if discard or conn.closed:
+                self._close_quietly(conn)
+                self._count("discarded")
+            else:
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pid": self._pid,
+                "max_size": self.max_size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                **self._metrics,
+            }
+
+
+db_pool = ConnectionPool(
+    get_db_connection,
+    default_pool_size(),
+    DB_POOL_TIMEOUT,
+    DB_POOL_HEALTHCHECK_AFTER,
+    # Connections opened through a tunnel that has since been rebuilt are dead.
+    is_stale=lambda conn: getattr(conn, "tunnel_generation", 0) != tunnel_supervisor.generation,
+)
+
+
+@contextmanager
+def db_cursor(commit: bool = False):
+    """Yield a cursor on a pooled connection, committing on success when asked to."""
+    with db_pool.connection() as conn:
+        cur = conn.cursor()
+        try:
+            yield cur
+            if commit:
+                conn.commit()
+        finally:
+            cur.close()
+
+
 @app.route("/crush_vehicles", methods=["GET", "POST"])
 def crush_vehicles():
     vehicle = None
@@ -570,20 +2217,15 @@ def crush_vehicles():
         reg = request.form.get("registration").strip()
         stock = request.form.get("stock_number").strip()
 
-        conn = get_db_connection()
-        cur = conn.cursor()
-
-        cur.execute("""
-            SELECT veh.stocknumber_id, veh.regnumber, st.vstockno, loc.bin
-            FROM vehicle veh
-            JOIN stocknumber st on st.stocknumber_id=veh.stocknumber_id
-            LEFT JOIN location loc on loc.location_id=veh.location_id
-            WHERE veh.regnumber = %s OR st.vstockno = %s
-        """, (reg, stock))
-        vehicle = cur.fetchone()
-
-        cur.close()
-        conn.close()
+        with db_cursor() as cur:
+            cur.execute("""
+                SELECT veh.stocknumber_id, veh.regnumber, st.vstockno, loc.bin
+                FROM vehicle veh
+                JOIN stocknumber st on st.stocknumber_id=veh.stocknumber_id
+                LEFT JOIN location loc on loc.location_id=veh.location_id
+                WHERE veh.regnumber = %s OR st.vstockno = %s
+            """, (reg, stock))
+            vehicle = cur.fetchone()
         
         
         user = session.get("username", "unknown")
@@ -597,12 +2239,8 @@ def crush_vehicles():
 
 @app.route("/crush/<int:vehicle_id>", methods=["POST"])
 def crush(vehicle_id):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("UPDATE vehicle SET location_id = %s WHERE stocknumber_id = %s", ("11045", vehicle_id))
-    conn.commit()
-    cur.close()
-    conn.close()
+    with db_cursor(commit=True) as cur:
+        cur.execute("UPDATE vehicle SET location_id = %s WHERE stocknumber_id = %s", ("11045", vehicle_id))
     
     user = session.get("username", "unknown")
     log_action("CRUSH", user, None, None, None, None, "CRUSHED SUCCESSFULLY")
@@ -610,21 +2248,15 @@ def crush(vehicle_id):
     return redirect(url_for("crush_vehicles"))
     
 def log_action(action, username, reg=None, stock=None, vstockno=None, location=None, status=None):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO public.hpd3281 (action, username, regnumber, stocknumber, vstockno, location, status)
-        VALUES (%s, %s, %s, %s, %s, %s, %s)
-    """, (action, username, reg, stock, vstockno, location, status))
-    conn.commit()
-    cur.close()
-    conn.close()
+    with db_cursor(commit=True) as cur:
+        cur.execute("""
+            INSERT INTO public.hpd3281 (action, username, regnumber, stocknumber, vstockno, location, status)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, (action, username, reg, stock, vstockno, location, status))
 
 
 def fetch_images_by_barcode(barcode: str) -> List[Tuple[str, Optional[int]]]:
-    conn = get_db_connection()
-    cur = conn.cursor()
-    try:
+    with db_cursor() as cur:
         cur.execute(
             """
             SELECT relativeurl, displayorder
@@ -636,138 +2268,517 @@ def fetch_images_by_barcode(barcode: str) -> List[Tuple[str, Optional[int]]]:
             (barcode,),
         )
         return cur.fetchall()
-    finally:
-        cur.close()
-        conn.close()
 
 
-def fetch_department_sales(start_date: date, end_date: date) -> List[Tuple[str, float, float]]:
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT departmentname,
-               SUM(total) AS sum_total,
-               SUM(total + totaltax1) AS sum_total_vat
-        FROM invoice
-        WHERE datecreated >= %s AND datecreated < %s
-        GROUP BY departmentname
-        ORDER BY departmentname
+# Daily rollups. Closed days are read from per-day aggregate tables kept by
+# the app; days from the cutoff onwards (today, and anything dated later) are
+# read from invoice/sold directly. The stats queries aggregate "fact rows"
+# from either source, so a year-long range costs a few hundred rollup rows.
+STATS_ROLLUP = os.environ.get("STATS_ROLLUP", "1") != "0"
+STATS_ROLLUP_INTERVAL = float(os.environ.get("STATS_ROLLUP_INTERVAL", "600"))
+# Closed days re-derived on every top-up, to pick up late edits to recent invoices.
+STATS_ROLLUP_REFRESH_DAYS = int(os.environ.get("STATS_ROLLUP_REFRESH_DAYS", "3"))
+STATS_ROLLUP_LOCK_ID = 7318021
+
+STATS_FACTS = {
+    "sales": {
+        "table": "stats_sales_daily",
+        "date_column": "datecreated",
+        # Monotonic row id, so live refreshes can read only the rows past a high-water mark.
+        "id_column": "invoice_id",
+        "raw": """
+            SELECT datecreated::date AS stat_date, departmentname, whocreated_id,
+                   total, total + totaltax1 AS total_vat{fact_id}
+            FROM invoice
+            WHERE {ranges}
         """,
-        (start_date, end_date),
-    )
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return rows
+        "keys": "stat_date, departmentname, whocreated_id",
+        "measures": "SUM(total) AS total, SUM(total_vat) AS total_vat",
+        "columns": "stat_date, departmentname, whocreated_id, total, total_vat",
+    },
+    "parts": {
+        "table": "stats_parts_daily",
+        "date_column": "solddate",
+        "raw": """
+            SELECT solddate::date AS stat_date, inv.departmentname, inv.whocreated_id, sold.itemtype_id,
+                   (sold.invnumber IS NOT NULL)::int AS parts_sold
+            FROM sold
+            LEFT JOIN invoice inv ON inv.invoice_id = sold.invoice_id
+            WHERE sold.issold AND ({ranges})
+        """,
+        "keys": "stat_date, departmentname, whocreated_id, itemtype_id",
+        "measures": "SUM(parts_sold)::int AS parts_sold",
+        "columns": "stat_date, departmentname, whocreated_id, itemtype_id, parts_sold",
+    },
+}
 
 
-def fetch_user_sales(start_date: date, end_date: date) -> List[Tuple[str, float, float]]:
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
+def date_ranges_clause(column: str, ranges: List[Tuple[date, date]]) -> Tuple[str, list]:
+    clause = " OR ".join(f"({column} >= %s AND {column} < %s)" for _ in ranges)
+    return clause, [value for date_range in ranges for value in date_range]
+
+
+def raw_fact_rows(
+    kind: str, ranges: List[Tuple[date, date]], with_id: bool = False, after_id: Optional[int] = None
+) -> Tuple[str, list]:
+    """Raw fact rows; ``with_id`` adds a fact_id column, limited to ids above ``after_id`` when given."""
+    facts = STATS_FACTS[kind]
+    clause, params = date_ranges_clause(facts["date_column"], ranges)
+    fact_id = ""
+    if with_id:
+        if "id_column" not in facts:
+            raise ValueError(f"{kind} facts have no row id")
+        fact_id = f", {facts['id_column']} AS fact_id"
+        if after_id is not None:
+            clause = f"({clause}) AND {facts['id_column']} > %s"
+            params.append(after_id)
+    return facts["raw"].format(ranges=clause, fact_id=fact_id), params
+
+
+def stats_fact_rows(kind: str, ranges: List[Tuple[date, date]]) -> Tuple[str, list]:
+    """SQL and parameters for the per-day fact rows of ``kind`` covering ``ranges``.
+
+    Sales rows carry stat_date, departmentname, whocreated_id, total and
+    total_vat; parts rows carry stat_date, departmentname, whocreated_id,
+    itemtype_id and parts_sold. Aggregating them gives the same answer as
+    aggregating invoice/sold over the same dates.
+    """
+    cutoff = stats_rollup.cutoff()
+    if cutoff is None:
+        return raw_fact_rows(kind, ranges)
+
+    rolled = [(start, min(end, cutoff)) for start, end in ranges if start < cutoff]
+    live = [(max(start, cutoff), end) for start, end in ranges if end > cutoff]
+    selects = []
+    params = []
+    if rolled:
+        facts = STATS_FACTS[kind]
+        clause, rolled_params = date_ranges_clause("stat_date", rolled)
+        selects.append(f"SELECT {facts['columns']} FROM {facts['table']} WHERE {clause}")
+        params += rolled_params
+    if live or not rolled:
+        live_sql, live_params = raw_fact_rows(kind, live or ranges)
+        selects.append(live_sql)
+        params += live_params
+    return " UNION ALL ".join(selects), params
+
+
+class StatsRollup:
+    """Maintains the daily rollup tables and the cutoff date below which they are complete.
+
+    Every process runs a background loop; whichever holds the advisory lock
+    backfills the tables on first run and afterwards re-derives the last few
+    closed days, while the rest just re-read the cutoff. A cutoff that lags
+    behind another process's is still correct, it only reads more raw rows.
+    """
+
+    def __init__(self, enabled: bool, interval: float, refresh_days: int):
+        self.enabled = enabled
+        self.interval = interval
+        self.refresh_days = refresh_days
+        self._cutoff = None
+        self._lock = threading.Lock()
+        self._pid = None
+        self._metrics = {"syncs": 0, "failures": 0, "rows_written": 0, "last_error": None, "last_sync_seconds": None}
+
+    def cutoff(self) -> Optional[date]:
+        """First day not covered by the rollups, or None until they are usable."""
+        self.start()
+        return self._cutoff
+
+    def start(self):
+        if not self.enabled or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._cutoff = None
+            threading.Thread(target=self._run, name="stats-rollup", daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                self.sync()
+            except Exception as e:
+                with self._lock:
+                    self._metrics["failures"] += 1
+                    self._metrics["last_error"] = str(e)
+                print("Stats rollup sync failed, reading raw rows past the last cutoff:", e)
+            time.sleep(self.interval)
+
+    def sync(self, rebuild: bool = False):
+        started = time.monotonic()
+        rows_written = 0
+        with db_cursor(commit=True) as cur:
+            cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (STATS_ROLLUP_LOCK_ID,))
+            if not cur.fetchone()[0]:
+                self._cutoff = self._read_cutoff(cur)
+                return
+            self._create_tables(cur)
+            cur.execute("SELECT rolled_until, CURRENT_DATE FROM stats_rollup_state WHERE name = 'daily'")
+            row = cur.fetchone()
+            if row is None or rebuild:
+                cur.execute("SELECT CURRENT_DATE")
+                rolled_until, today = None, cur.fetchone()[0]
+            else:
+                rolled_until, today = row
+            since = date.min if rolled_until is None else rolled_until - timedelta(days=self.refresh_days)
+            for kind, facts in STATS_FACTS.items():
+                raw_sql, params = raw_fact_rows(kind, [(since, today)])
+                cur.execute(f"DELETE FROM {facts['table']} WHERE stat_date >= %s", (since,))
+                cur.execute(
+                    f"""
+                    INSERT INTO {facts['table']} ({facts['columns']})
+                    SELECT {facts['keys']}, {facts['measures']}
+                    FROM ({raw_sql}) facts
+                    GROUP BY {facts['keys']}
+                    """,
+                    params,
+                )
+                rows_written += cur.rowcount
+            cur.execute(
+                """
+                INSERT INTO stats_rollup_state (name, rolled_until) VALUES ('daily', %s)
+                ON CONFLICT (name) DO UPDATE SET rolled_until = EXCLUDED.rolled_until
+                """,
+                (today,),
+            )
+        self._cutoff = today
+        with self._lock:
+            self._metrics["syncs"] += 1
+            self._metrics["rows_written"] += rows_written
+            self._metrics["last_sync_seconds"] = round(time.monotonic() - started, 3)
+        if rolled_until is None:
+            print(f"Backfilled the stats rollups up to {today}: {rows_written} rows in {time.monotonic() - started:.1f}s")
+
+    @staticmethod
+    def _read_cutoff(cur) -> Optional[date]:
+        cur.execute("SELECT to_regclass('stats_rollup_state') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return None
+        cur.execute("SELECT rolled_until FROM stats_rollup_state WHERE name = 'daily'")
+        row = cur.fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _create_tables(cur):
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS stats_rollup_state (name text PRIMARY KEY, rolled_until date NOT NULL)"
+        )
+        for kind, facts in STATS_FACTS.items():
+            # Column types follow the source tables, so sums come back as the same types as before.
+            raw_sql, params = raw_fact_rows(kind, [(date.min, date.min)])
+            cur.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {facts['table']} AS
+                SELECT {facts['keys']}, {facts['measures']}
+                FROM ({raw_sql}) facts
+                GROUP BY {facts['keys']}
+                WITH NO DATA
+                """,
+                params,
+            )
+            cur.execute(f"CREATE INDEX IF NOT EXISTS {facts['table']}_stat_date_idx ON {facts['table']} (stat_date)")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "cutoff": self._cutoff.isoformat() if self._cutoff else None,
+                **self._metrics,
+            }
+
+
+stats_rollup = StatsRollup(STATS_ROLLUP, STATS_ROLLUP_INTERVAL, STATS_ROLLUP_REFRESH_DAYS)
+
+
+@app.cli.command("rebuild-stats-rollup")
+def rebuild_stats_rollup():
+    """Recompute the daily stats rollups from scratch."""
+    stats_rollup.sync(rebuild=True)
+    print(stats_rollup.stats())
+
+
+# Stats aggregation builder. Every stats query has the same shape: fact rows
+# (see stats_fact_rows) for a metric, joined to the dimension's entity and
+# grouped at some grain. Each distinct statement is prepared once per pooled
+# connection and executed by name afterwards.
+STATS_PREPARED_STATEMENTS = os.environ.get("STATS_PREPARED_STATEMENTS", "1") != "0"
+# One statement serves "today", "month" and "year" alike, so with the default
+# plan_cache_mode PostgreSQL may settle on a generic plan after five runs that
+# ignores how wide the range is. Forcing custom plans re-plans every EXECUTE
+# (parsing is still saved); set STATS_PLAN_CACHE_MODE= to keep the server default.
+STATS_PLAN_CACHE_MODE = os.environ.get("STATS_PLAN_CACHE_MODE", "force_custom_plan")
+
+STATS_METRICS = {
+    "sales": [("SUM(total)", "sum_total"), ("SUM(total_vat)", "sum_total_vat")],
+    "parts": [("SUM(parts_sold)", "parts_sold")],
+}
+
+# entity: the name shown per row; group/order: how rows were grouped and sorted
+# before the builder existed, kept so results and their order are unchanged.
+STATS_DIMENSIONS = {
+    ("sales", "department"): {
+        "entity": "departmentname", "group": "departmentname", "order": "departmentname", "joins": "",
+    },
+    ("sales", "user"): {
+        "entity": "us.shortname", "group": "us.shortname", "order": "us.shortname",
+        "joins": "JOIN pinuser us ON us.user_id = facts.whocreated_id",
+    },
+    ("parts", "department"): {
+        "entity": "COALESCE(facts.departmentname, 'Unknown')", "group": "facts.departmentname", "order": "entity",
+        "joins": "",
+    },
+    ("parts", "user"): {
+        "entity": "COALESCE(us.shortname, 'Unknown')", "group": "us.shortname", "order": "us.shortname",
+        "joins": "LEFT JOIN pinuser us ON us.user_id = facts.whocreated_id",
+    },
+}
+
+STATS_GRAINS = {
+    "month": {"key": "EXTRACT(MONTH FROM stat_date)::int AS month", "group": "month", "order": "month"},
+    "day": {"key": "EXTRACT(DAY FROM stat_date)::int AS day", "group": "day", "order": "day"},
+    "date": {"key": "stat_date", "group": "stat_date", "order": "stat_date"},
+    "itemname": {
+        "key": "COALESCE(REPLACE(REPLACE(REPLACE(it.itemname, '[', ''), ']', ''), '_', ' '), 'Unknown') AS itemname",
+        "group": "itemname",
+        "order": "parts_sold DESC, itemname",
+        "joins": "LEFT JOIN itemtype it ON it.itemtype_id = facts.itemtype_id",
+    },
+}
+
+
+def build_stats_query(
+    metric: str,
+    dimension: str,
+    grain: str,
+    ranges: List[Tuple[date, date]],
+    entity: Optional[str] = None,
+    previous: Optional[Tuple[date, date]] = None,
+) -> Tuple[str, list]:
+    """SQL and parameters for one stats aggregation.
+
+    The "range" grain returns (entity, *measures) per entity over ``ranges``;
+    with ``previous`` it instead returns (entity, value, previous value) for
+    entities with rows in the first range. Every other grain returns
+    (key, value) rows for the single ``entity``.
+    """
+    if grain == "itemname" and metric != "parts":
+        raise ValueError("The itemname grain only exists for parts")
+    dim = STATS_DIMENSIONS[(metric, dimension)]
+    measures = [f"{expression} AS {alias}" for expression, alias in STATS_METRICS[metric]]
+
+    if grain == "range":
+        if previous is None:
+            facts, params = stats_fact_rows(metric, ranges)
+            select = [f"{dim['entity']} AS entity"] + measures
+            having = ""
+        else:
+            facts, params = stats_fact_rows(metric, ranges + [previous])
+            value = STATS_METRICS[metric][0][0]
+            in_range = "stat_date >= %s AND stat_date < %s"
+            select = [
+                f"{dim['entity']} AS entity",
+                f"{value} FILTER (WHERE {in_range}) AS value",
+                f"COALESCE({value} FILTER (WHERE {in_range}), 0) AS prev_value",
+            ]
+            params = [*ranges[0], *previous] + params + [*ranges[0]]
+            having = f"HAVING COUNT(*) FILTER (WHERE {in_range}) > 0"
+        sql = f"""
+            SELECT {', '.join(select)}
+            FROM ({facts}) facts
+            {dim['joins']}
+            GROUP BY {dim['group']}
+            {having}
+            ORDER BY {dim['order']}
         """
-        SELECT us.shortname,
-               SUM(total) AS sum_total,
-               SUM(total + totaltax1) AS sum_total_vat
-        FROM invoice
-        JOIN pinuser us ON us.user_id = invoice.whocreated_id
-        WHERE datecreated >= %s AND datecreated < %s
-        GROUP BY us.shortname
-        ORDER BY us.shortname
-        """,
-        (start_date, end_date),
-    )
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return rows
+        return sql, params
+
+    grouping = STATS_GRAINS[grain]
+    facts, params = stats_fact_rows(metric, ranges)
+    sql = f"""
+        SELECT {grouping['key']}, {measures[0]}
+        FROM ({facts}) facts
+        {dim['joins']}
+        {grouping.get('joins', '')}
+        WHERE {dim['entity']} = %s
+        GROUP BY {grouping['group']}
+        ORDER BY {grouping['order']}
+    """
+    return sql, params + [entity]
+
+
+def build_stats_delta_query(
+    metric: str, dimension: str, ranges: List[Tuple[date, date]], after_id: Optional[int] = None
+) -> Tuple[str, list]:
+    """SQL and parameters for a "range" aggregation over raw rows only, for live refreshes.
+
+    Returns (entity, *measures, last_fact_id) per entity, over the rows with
+    an id above ``after_id`` when given. Measures are never NULL, so they can
+    be added to running totals.
+    """
+    dim = STATS_DIMENSIONS[(metric, dimension)]
+    measures = [f"COALESCE({expression}, 0) AS {alias}" for expression, alias in STATS_METRICS[metric]]
+    facts, params = raw_fact_rows(metric, ranges, with_id=True, after_id=after_id)
+    sql = f"""
+        SELECT {dim['entity']} AS entity, {', '.join(measures)}, MAX(facts.fact_id) AS last_fact_id
+        FROM ({facts}) facts
+        {dim['joins']}
+        GROUP BY {dim['group']}
+    """
+    return sql, params
+
+
+class PreparedStatsQueries:
+    """Runs stats queries as named prepared statements, preparing each once per connection.
+
+    Statement names come from a hash of the SQL, so the facts variants a
+    rollup cutoff produces get their own statements. Prepared statements live
+    as long as the session, so connections the pool replaces start afresh.
+    A connection's plan_cache_mode is set (and committed, so the pool's
+    rollback keeps it) before its first statement is prepared; servers older
+    than PostgreSQL 12 have no such setting and keep their default.
+    """
+
+    def __init__(self, enabled: bool, plan_cache_mode: str):
+        self.enabled = enabled
+        self.plan_cache_mode = plan_cache_mode
+        self._prepared = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._metrics = {"executed": 0, "prepared": 0}
+
+    @staticmethod
+    def statement_name(sql: str, prefix: str = "stats_") -> str:
+        return prefix + hashlib.sha1(sql.encode()).hexdigest()[:16]
+
+    @staticmethod
+    def prepare_sql(name: str, sql: str, param_count: int) -> str:
+        numbered = iter(range(1, param_count + 1))
+        return f"PREPARE {name} AS " + re.sub("%s", lambda _: f"${next(numbered)}", sql)
+
+    @staticmethod
+    def execute_sql(name: str, param_count: int) -> str:
+        return f"EXECUTE {name} ({', '.join(['%s'] * param_count)})" if param_count else f"EXECUTE {name}"
+
+    def plan_cache_mode_for(self, conn) -> Optional[str]:
+        """The plan_cache_mode to set on ``conn``, or None where the server has no such setting."""
+        if not self.plan_cache_mode or conn.server_version < 120000:
+            return None
+        return self.plan_cache_mode
+
+    def run(self, sql: str, params: list) -> List[tuple]:
+        with db_cursor() as cur:
+            if self.enabled:
+                name = self.statement_name(sql)
+                with self._lock:
+                    prepared = self._prepared.get(cur.connection)
+                if prepared is None:
+                    plan_cache_mode = self.plan_cache_mode_for(cur.connection)
+                    if plan_cache_mode:
+                        cur.execute("SET plan_cache_mode = %s", [plan_cache_mode])
+                        cur.connection.commit()
+                    with self._lock:
+                        prepared = self._prepared.setdefault(cur.connection, set())
+                if name not in prepared:
+                    cur.execute(self.prepare_sql(name, sql, len(params)))
+                    prepared.add(name)
+                    self._count("prepared")
+                cur.execute(self.execute_sql(name, len(params)), params)
+            else:
+                cur.execute(sql, params)
+            self._count("executed")
+            return cur.fetchall()
+
+    def _count(self, key: str):
+        with self._lock:
+            self._metrics[key] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "prepared_statements": self.enabled,
+                "plan_cache_mode": self.plan_cache_mode or None,
+                "connections": len(self._prepared),
+                **self._metrics,
+            }
+
+
+stats_queries = PreparedStatsQueries(STATS_PREPARED_STATEMENTS, STATS_PLAN_CACHE_MODE)
+
+
+def stats_aggregate(
+    metric: str,
+    dimension: str,
+    grain: str,
+    ranges: List[Tuple[date, date]],
+    entity: Optional[str] = None,
+    previous: Optional[Tuple[date, date]] = None,
+) -> List[tuple]:
+    return stats_queries.run(*build_stats_query(metric, dimension, grain, ranges, entity, previous))
+
+
+def year_range(year: int) -> Tuple[date, date]:
+    return date(year, 1, 1), date(year + 1, 1, 1)
+
+
+def month_range(year: int, month: int) -> Tuple[date, date]:
+    if month == 12:
+        return date(year, 12, 1), date(year + 1, 1, 1)
+    return date(year, month, 1), date(year, month + 1, 1)
+
+
+def fetch_department_sales(start_date: date, end_date: date) -> List[Tuple[str, float, float]]:
+    return stats_aggregate("sales", "department", "range", [(start_date, end_date)])
+
+
+def fetch_user_sales(start_date: date, end_date: date) -> List[Tuple[str, float, float]]:
+    return stats_aggregate("sales", "user", "range", [(start_date, end_date)])
 
 
 def fetch_department_parts_sold(start_date: date, end_date: date) -> List[Tuple[str, float, float]]:
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT COALESCE(inv.departmentname, 'Unknown') AS departmentname,
-               COUNT(sold.invnumber) AS parts_sold
-        FROM sold
-        LEFT JOIN invoice inv ON inv.invoice_id = sold.invoice_id
-        WHERE sold.issold AND solddate >= %s AND solddate < %s
-        GROUP BY departmentname
-        ORDER BY departmentname
-        """,
-        (start_date, end_date),
-    )
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+    rows = stats_aggregate("parts", "department", "range", [(start_date, end_date)])
     # Reuse the same tuple shape as sales totals so the rest of the code can stay generic.
     return [(row[0], float(row[1]), float(row[1])) for row in rows]
 
 
 def fetch_user_parts_sold(start_date: date, end_date: date) -> List[Tuple[str, float, float]]:
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT COALESCE(us.shortname, 'Unknown') AS shortname,
-               COUNT(sold.invnumber) AS parts_sold
-        FROM sold
-        LEFT JOIN invoice inv ON inv.invoice_id = sold.invoice_id
-        LEFT JOIN pinuser us ON us.user_id = inv.whocreated_id
-        WHERE sold.issold AND solddate >= %s AND solddate < %s
-        GROUP BY us.shortname
-        ORDER BY us.shortname
-        """,
-        (start_date, end_date),
-    )
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+    rows = stats_aggregate("parts", "user", "range", [(start_date, end_date)])
     return [(row[0], float(row[1]), float(row[1])) for row in rows]
 
 
+def fetch_parts_sold_with_previous(
+    dimension: str, start_date: date, end_date: date, prev_start: date, prev_end: date
+) -> Tuple[List[Tuple[str, float, float]], List[Tuple[str, float, float]]]:
+    """Parts sold per entity for a range and its previous period, in one scan.
+
+    Returns the same (rows, prev_rows) as calling fetch_department_parts_sold /
+    fetch_user_parts_sold once per range, except that prev_rows only covers
+    entities with rows in the current range, which is all the stats view reads.
+    """
+    rows = stats_aggregate("parts", dimension, "range", [(start_date, end_date)], previous=(prev_start, prev_end))
+    return (
+        [(row[0], float(row[1]), float(row[1])) for row in rows],
+        [(row[0], float(row[2]), float(row[2])) for row in rows],
+    )
+
+
+def fetch_sales_delta(
+    dimension: str, start_date: date, end_date: date, after_invoice_id: Optional[int]
+) -> Tuple[List[Tuple[str, float, float]], Optional[int]]:
+    """Sales totals per entity for invoices with an id above ``after_invoice_id``, and the highest id seen."""
+    rows = stats_queries.run(*build_stats_delta_query("sales", dimension, [(start_date, end_date)], after_invoice_id))
+    high_water = max((row[3] for row in rows), default=None)
+    return [(row[0], row[1], row[2]) for row in rows], high_water
+
+
 def fetch_parts_breakdown(
     entity_value: str, start_date: date, end_date: date, dimension: str
 ) -> List[Tuple[str, int]]:
     """Return itemname counts for the given department or user."""
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-
     dimension_key = "user" if normalize_stats_dimension(dimension) == "user" else "department"
-    joins = """
-        LEFT JOIN invoice inv ON inv.invoice_id = sold.invoice_id
-        LEFT JOIN itemtype it ON it.itemtype_id = sold.itemtype_id
-    """
-    filter_clause = "COALESCE(inv.departmentname, 'Unknown') = %s"
-    params = [start_date, end_date, entity_value]
-
-    if dimension_key == "user":
-        joins += " LEFT JOIN pinuser us ON us.user_id = inv.whocreated_id"
-        filter_clause = "COALESCE(us.shortname, 'Unknown') = %s"
-
-    cur.execute(
-        f"""
-        SELECT
-            COALESCE(REPLACE(REPLACE(REPLACE(it.itemname, '[', ''), ']', ''), '_', ' '), 'Unknown') AS itemname,
-            COUNT(sold.invnumber) AS parts_sold
-        FROM sold
-        {joins}
-        WHERE sold.issold
-          AND solddate >= %s
-          AND solddate < %s
-          AND {filter_clause}
-        GROUP BY itemname
-        ORDER BY parts_sold DESC, itemname
-        """,
-        params,
-    )
-
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+    rows = stats_aggregate("parts", dimension_key, "itemname", [(start_date, end_date)], entity=entity_value)
     return [(row[0], int(row[1])) for row in rows]
 
 def shift_one_month_back(value: date) -> date:
@@ -784,168 +2795,343 @@ def shift_one_month_back(value: date) -> date:
 
 
 def fetch_department_monthly_totals(department: str, year: int) -> List[Tuple[int, float]]:
-    start_year = date(year, 1, 1)
-    start_next_year = date(year + 1, 1, 1)
-
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT EXTRACT(MONTH FROM datecreated)::int AS month,
-               SUM(total) AS sum_total
-        FROM invoice
-        WHERE datecreated >= %s
-          AND datecreated < %s
-          AND departmentname = %s
-        GROUP BY month
-        ORDER BY month
-        """,
-        (start_year, start_next_year, department),
-    )
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return rows
+    return stats_aggregate("sales", "department", "month", [year_range(year)], entity=department)
 
 
 def fetch_department_parts_monthly_totals(department: str, year: int) -> List[Tuple[int, float]]:
-    start_year = date(year, 1, 1)
-    start_next_year = date(year + 1, 1, 1)
-
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT EXTRACT(MONTH FROM solddate)::int AS month,
-               COUNT(sold.invnumber) AS parts_sold
-        FROM sold
-        LEFT JOIN invoice inv ON inv.invoice_id = sold.invoice_id
-        WHERE solddate >= %s
-          AND solddate < %s
-          AND COALESCE(inv.departmentname, 'Unknown') = %s
-          AND sold.issold
-        GROUP BY month
-        ORDER BY month
-        """,
-        (start_year, start_next_year, department),
-    )
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return rows
+    return stats_aggregate("parts", "department", "month", [year_range(year)], entity=department)
 
 
 def fetch_user_monthly_totals(user: str, year: int) -> List[Tuple[int, float]]:
-    start_year = date(year, 1, 1)
-    start_next_year = date(year + 1, 1, 1)
+    return stats_aggregate("sales", "user", "month", [year_range(year)], entity=user)
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT EXTRACT(MONTH FROM datecreated)::int AS month,
-               SUM(total) AS sum_total
-        FROM invoice inv
-        JOIN pinuser us ON us.user_id = inv.whocreated_id
-        WHERE datecreated >= %s
-          AND datecreated < %s
-          AND us.shortname = %s
-        GROUP BY month
-        ORDER BY month
-        """,
-        (start_year, start_next_year, user),
-    )
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return rows
+
+def fetch_user_parts_monthly_totals(user: str, year: int) -> List[Tuple[int, float]]:
+    return stats_aggregate("parts", "user", "month", [year_range(year)], entity=user)
 
 
 def fetch_department_daily_totals(department: str, year: int, month: int) -> List[Tuple[int, float]]:
-    start_month = date(year, month, 1)
-    if month == 12:
-        start_next_month = date(year + 1, 1, 1)
-    else:
-        start_next_month = date(year, month + 1, 1)
+    return stats_aggregate("sales", "department", "day", [month_range(year, month)], entity=department)
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT EXTRACT(DAY FROM datecreated)::int AS day,
-               SUM(total) AS sum_total
-        FROM invoice
-        WHERE datecreated >= %s
-          AND datecreated < %s
-          AND departmentname = %s
-        GROUP BY day
-        ORDER BY day
-        """,
-        (start_month, start_next_month, department),
+
+def fetch_user_daily_totals(user: str, year: int, month: int) -> List[Tuple[int, float]]:
+    return stats_aggregate("sales", "user", "day", [month_range(year, month)], entity=user)
+
+
+def fetch_department_parts_daily_totals(department: str, year: int, month: int) -> List[Tuple[int, float]]:
+    return stats_aggregate("parts", "department", "day", [month_range(year, month)], entity=department)
+
+
+def fetch_user_parts_daily_totals(user: str, year: int, month: int) -> List[Tuple[int, float]]:
+    return stats_aggregate("parts", "user", "day", [month_range(year, month)], entity=user)
+
+
+def fetch_daily_series(mode: str, dimension: str, entity: str, start_date: date, end_date: date) -> List[Tuple[date, float]]:
+    """Per-day totals for one department or user, for days with any sales or parts sold."""
+    metric = "parts" if mode == "parts" else "sales"
+    return stats_aggregate(metric, dimension, "date", [(start_date, end_date)], entity=entity)
+
+
+# One recently active entity per dimension for the single-entity query shapes.
+# Each is a LIMIT 1 walk back along invoice's primary key, not an aggregation.
+STATS_SAMPLE_ENTITY_SQL = {
+    "department": """
+        SELECT departmentname FROM invoice
+        WHERE departmentname IS NOT NULL
+        ORDER BY invoice_id DESC LIMIT 1
+    """,
+    "user": """
+        SELECT us.shortname FROM invoice
+        JOIN pinuser us ON us.user_id = invoice.whocreated_id
+        ORDER BY invoice.invoice_id DESC LIMIT 1
+    """,
+}
+
+
+# The newest invoice id, standing in for a live board's high-water mark.
+STATS_SAMPLE_HIGH_WATER_SQL = "SELECT invoice_id FROM invoice ORDER BY invoice_id DESC LIMIT 1"
+
+
+def stats_query_samples() -> dict:
+    """A recently active entity per dimension ("Unknown" when there is none), and the newest invoice id."""
+    entities = {}
+    with db_cursor() as cur:
+        for dimension, sql in STATS_SAMPLE_ENTITY_SQL.items():
+            cur.execute(sql)
+            row = cur.fetchone()
+            entities[dimension] = row[0] if row else "Unknown"
+        cur.execute(STATS_SAMPLE_HIGH_WATER_SQL)
+        row = cur.fetchone()
+        entities["high_water"] = row[0] if row else 0
+    return entities
+
+
+def stats_query_cases(today: date) -> List[Tuple[str, Callable, tuple]]:
+    """(label, builder, builder arguments) for every query shape over representative ranges.
+
+    The builder is build_stats_query, or build_stats_delta_query for the live
+    sales refreshes: the read of the open days at a full load, and the
+    per-tick read of the invoices past the high-water mark.
+    """
+    periods = {
+        "today": (today, today + timedelta(days=1)),
+        "month": month_range(today.year, today.month),
+        "year": year_range(today.year),
+    }
+    samples = stats_query_samples()
+    cases = []
+    for metric, dimension in STATS_DIMENSIONS:
+        entity = samples[dimension]
+        for period in periods:
+            cases.append((f"{metric}/{dimension}/range {period}", build_stats_query, (metric, dimension, "range", [periods[period]])))
+        if metric == "parts":
+            previous = tuple(shift_one_month_back(value) for value in periods["month"])
+            cases.append((f"{metric}/{dimension}/range month+prev", build_stats_query, (metric, dimension, "range", [periods["month"]], None, previous)))
+            cases.append((f"{metric}/{dimension}/itemname month", build_stats_query, (metric, dimension, "itemname", [periods["month"]], entity)))
+        else:
+            live = [(today, periods["month"][1])]
+            cases.append((f"{metric}/{dimension}/live full", build_stats_delta_query, (metric, dimension, live)))
+            cases.append((f"{metric}/{dimension}/live since mark", build_stats_delta_query, (metric, dimension, live, samples["high_water"])))
+        cases.append((f"{metric}/{dimension}/month year", build_stats_query, (metric, dimension, "month", [periods["year"]], entity)))
+        cases.append((f"{metric}/{dimension}/day month", build_stats_query, (metric, dimension, "day", [periods["month"]], entity)))
+        cases.append((f"{metric}/{dimension}/date year", build_stats_query, (metric, dimension, "date", [periods["year"]], entity)))
+    return cases
+
+
+def use_cli_database(dsn: Optional[str], rollup: bool):
+    """Point a CLI run at ``dsn`` if given, and pin the rollup cutoff for its duration."""
+    global db_pool
+    if dsn:
+        db_pool = ConnectionPool(lambda: psycopg2.connect(dsn), 1, DB_POOL_TIMEOUT, DB_POOL_HEALTHCHECK_AFTER)
+    # No background sync during the run; the cutoff only moves if synced here.
+    stats_rollup.enabled = False
+    if rollup:
+        stats_rollup.sync()
+
+
+@app.cli.command("bench-stats-queries")
+@click.option("--dsn", default=None, help="Connect straight to this PostgreSQL DSN instead of through the SSH tunnel.")
+@click.option("--repeat", default=20, show_default=True, help="Runs of each query per mode.")
+@click.option("--rollup/--no-rollup", default=True, show_default=True, help="Sync the daily rollups first and read closed days from them.")
+def bench_stats_queries(dsn, repeat, rollup):
+    """Time every stats aggregation plain and prepared, and count the statements each runs.
+
+    Each prepared result is also checked against the plain one. The range
+    queries are also run with today, month and year interleaved, since they
+    share one prepared statement and so one plan cache.
+    """
+    use_cli_database(dsn, rollup)
+    print(
+        f"rollup cutoff: {stats_rollup.stats()['cutoff']}, plan_cache_mode: {STATS_PLAN_CACHE_MODE or 'server default'}, "
+        f"{repeat} runs each"
     )
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return rows
 
+    def compare(label, runs):
+        timings = []
+        results = []
+        for enabled in (False, True):
+            stats_queries.enabled = enabled
+            before = stats_queries.stats()
+            started = time.perf_counter()
+            for _ in range(repeat):
+                rows = [stats_queries.run(*build(*args)) for build, args in runs]
+            timings.append((time.perf_counter() - started) / repeat * 1000)
+            results.append(rows)
+        after = stats_queries.stats()
+        print(
+            f"{label:<36} {timings[0]:7.2f}ms {timings[1]:8.2f}ms  "
+            f"{after['executed'] - before['executed']} run, {after['prepared'] - before['prepared']} prepared"
+            f"{'' if results[0] == results[1] else '  RESULTS DIFFER'}"
+        )
 
-def fetch_user_daily_totals(user: str, year: int, month: int) -> List[Tuple[int, float]]:
-    start_month = date(year, month, 1)
-    if month == 12:
-        start_next_month = date(year + 1, 1, 1)
-    else:
-        start_next_month = date(year, month + 1, 1)
+    print(f"{'query':<36} {'plain':>9} {'prepared':>10}  statements")
+    mixed = {}
+    for label, build, args in stats_query_cases(date.today()):
+        compare(label, [(build, args)])
+        shape, _, period = label.rpartition(" ")
+        if shape.endswith("/range") and period in ("today", "month", "year"):
+            mixed.setdefault(shape, []).append((build, args))
+    for shape, runs in mixed.items():
+        compare(f"{shape} mixed", runs)
+    stats_queries.enabled = STATS_PREPARED_STATEMENTS
+
+
+# Query health. EXPLAIN (ANALYZE, BUFFERS) over every stats query shape, flagging
+# sequential scans of large tables with the index that would cover their filter.
+STATS_HEALTH_SEQ_SCAN_MIN_ROWS = int(os.environ.get("STATS_HEALTH_SEQ_SCAN_MIN_ROWS", "10000"))
+STATS_HEALTH_SLOW_MS = float(os.environ.get("STATS_HEALTH_SLOW_MS", "250"))
+# ANALYZE runs every query, year-range scans included, so only the CLI does.
+# /admin/stats_health is off unless STATS_HEALTH_ROUTE=1 and then serves a
+# plain EXPLAIN report (estimates only), built by one request at a time and
+# reused for STATS_HEALTH_ROUTE_TTL seconds.
+STATS_HEALTH_ROUTE = os.environ.get("STATS_HEALTH_ROUTE", "0") == "1"
+STATS_HEALTH_ROUTE_TTL = float(os.environ.get("STATS_HEALTH_ROUTE_TTL", "900"))
+# Filter columns worth indexing per table, equality columns ahead of the date
+# range, and the predicate the stats queries always apply (for a partial index).
+STATS_INDEX_CANDIDATES = {
+    "invoice": {"columns": ["departmentname", "whocreated_id", "datecreated"], "where": None},
+    "sold": {"columns": ["solddate"], "where": "issold"},
+    "stats_sales_daily": {"columns": ["departmentname", "whocreated_id", "stat_date"], "where": None},
+    "stats_parts_daily": {"columns": ["departmentname", "whocreated_id", "stat_date"], "where": None},
+}
+
+
+def plan_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
 
-    conn = get_db_connection()
-    cur = conn.cursor()
+
+def existing_index_columns(cur) -> dict:
+    """Leading-to-trailing column lists of the indexes on the tables the stats queries read."""
     cur.execute(
-        """
-        SELECT EXTRACT(DAY FROM datecreated)::int AS day,
-               SUM(total) AS sum_total
-        FROM invoice inv
-        JOIN pinuser us ON us.user_id = inv.whocreated_id
-        WHERE datecreated >= %s
-          AND datecreated < %s
-          AND us.shortname = %s
-        GROUP BY day
-        ORDER BY day
-        """,
-        (start_month, start_next_month, user),
+        "SELECT tablename, indexdef FROM pg_indexes WHERE tablename = ANY(%s)", (list(STATS_INDEX_CANDIDATES),)
     )
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return rows
+    indexes = {}
+    for table, definition in cur.fetchall():
+        found = re.search(r"USING \w+ \(([^)]*)\)", definition)
+        if found:
+            indexes.setdefault(table, []).append([column.strip() for column in found.group(1).split(",")])
+    return indexes
+
+
+def suggest_index(relation: str, filter_text: Optional[str], existing: List[List[str]]) -> Optional[str]:
+    """CREATE INDEX statement covering a sequential scan's filter, unless an index already does."""
+    candidate = STATS_INDEX_CANDIDATES.get(relation)
+    if candidate is None or not filter_text:
+        return None
+    columns = [column for column in candidate["columns"] if re.search(rf"\b{column}\b", filter_text)]
+    if not columns or any(index[: len(columns)] == columns for index in existing):
+        # Nothing to index, or the planner chose a scan over an existing index
+        # because the range covers most of the table.
+        return None
+    where = candidate["where"] if candidate["where"] and re.search(rf"\b{candidate['where']}\b", filter_text) else None
+    name = "_".join([relation, *columns, *([where] if where else []), "idx"])
+    statement = f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {relation} ({', '.join(columns)})"
+    return f"{statement} WHERE {where}" if where else statement
+
+
+def table_row_estimates(cur) -> dict:
+    """The planner's row count for each table the stats queries read."""
+    cur.execute(
+        "SELECT relname, reltuples FROM pg_class WHERE relkind IN ('r', 'p', 'm') AND relname = ANY(%s)",
+        (list(STATS_INDEX_CANDIDATES),),
+    )
+    return {table: max(0, int(rows)) for table, rows in cur.fetchall()}
 
 
-def fetch_department_parts_daily_totals(department: str, year: int, month: int) -> List[Tuple[int, float]]:
-    start_month = date(year, month, 1)
-    if month == 12:
-        start_next_month = date(year + 1, 1, 1)
+def explain_stats_query(cur, sql: str, params: list, indexes: dict, analyze: bool, table_rows: dict) -> dict:
+    options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "SUMMARY, FORMAT JSON"
+    if stats_queries.enabled:
+        # Plan it the way production runs it: as a prepared statement, under
+        # the same plan_cache_mode (set by stats_query_health).
+        name = PreparedStatsQueries.statement_name(sql, "stats_health_")
+        cur.execute(PreparedStatsQueries.prepare_sql(name, sql, len(params)))
+        try:
+            cur.execute(f"EXPLAIN ({options}) " + PreparedStatsQueries.execute_sql(name, len(params)), params)
+            plan = cur.fetchone()[0][0]
+        except psycopg2.Error:
+            # DEALLOCATE needs a live transaction, and prepared statements outlive a rollback.
+            cur.connection.rollback()
+            cur.execute(f"DEALLOCATE {name}")
+            raise
+        cur.execute(f"DEALLOCATE {name}")
     else:
-        start_next_month = date(year, month + 1, 1)
+        cur.execute(f"EXPLAIN ({options}) " + sql, params)
+        plan = cur.fetchone()[0][0]
+    seq_scans = []
+    for node in plan_nodes(plan["Plan"]):
+        if node["Node Type"] != "Seq Scan":
+            continue
+        if analyze:
+            rows_scanned = int((node.get("Actual Rows", 0) + node.get("Rows Removed by Filter", 0)) * node.get("Actual Loops", 1))
+        else:
+            # A plain plan only estimates the rows the filter keeps; a seq scan reads the whole table.
+            rows_scanned = table_rows.get(node["Relation Name"], int(node.get("Plan Rows", 0)))
+        if rows_scanned < STATS_HEALTH_SEQ_SCAN_MIN_ROWS:
+            continue
+        seq_scans.append(
+            {
+                "relation": node["Relation Name"],
+                "rows_scanned": rows_scanned,
+                "filter": node.get("Filter"),
+                "suggested_index": suggest_index(
+                    node["Relation Name"], node.get("Filter"), indexes.get(node["Relation Name"], [])
+                ),
+            }
+        )
+    execution_ms = plan.get("Execution Time")
+    return {
+        "planning_ms": round(plan["Planning Time"], 3),
+        "execution_ms": round(execution_ms, 3) if execution_ms is not None else None,
+        "total_cost": plan["Plan"]["Total Cost"],
+        "shared_hit_blocks": plan["Plan"].get("Shared Hit Blocks"),
+        "shared_read_blocks": plan["Plan"].get("Shared Read Blocks"),
+        "slow": execution_ms is not None and execution_ms >= STATS_HEALTH_SLOW_MS,
+        "seq_scans": seq_scans,
+    }
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT EXTRACT(DAY FROM solddate)::int AS day,
-               COUNT(sold.invnumber) AS parts_sold
-        FROM sold
-        LEFT JOIN invoice inv ON inv.invoice_id = sold.invoice_id
-        WHERE solddate >= %s
-          AND solddate < %s
-          AND COALESCE(inv.departmentname, 'Unknown') = %s
-          AND sold.issold
-        GROUP BY day
-        ORDER BY day
-        """,
-        (start_month, start_next_month, department),
+
+def stats_health_plan_source(plan_cache_mode: Optional[str]) -> str:
+    """How the report's plans relate to the ones production uses, given the plan_cache_mode in effect."""
+    if not stats_queries.enabled:
+        return "plain statements, as production runs them (STATS_PREPARED_STATEMENTS=0)"
+    if plan_cache_mode == "force_custom_plan":
+        return "EXPLAIN EXECUTE of prepared statements under plan_cache_mode=force_custom_plan, as production runs them"
+    return (
+        f"EXPLAIN EXECUTE of prepared statements under plan_cache_mode={plan_cache_mode or 'server default'}; "
+        "these are custom plans for the parameters shown, but production may switch a statement to a generic plan "
+        "after repeated executions, which this report does not show"
     )
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return rows
+
+
+def stats_query_health(analyze: bool = True) -> dict:
+    """EXPLAIN (ANALYZE unless ``analyze`` is off) report for every stats query shape, with the indexes worth adding."""
+    cases = stats_query_cases(date.today())
+    queries = []
+    with db_cursor() as cur:
+        plan_cache_mode = stats_queries.plan_cache_mode_for(cur.connection) if stats_queries.enabled else None
+        if plan_cache_mode:
+            # Not committed: the pool's rollback restores the connection's own setting.
+            cur.execute("SET plan_cache_mode = %s", [plan_cache_mode])
+        indexes = existing_index_columns(cur)
+        table_rows = {} if analyze else table_row_estimates(cur)
+        for label, build, args in cases:
+            sql, params = build(*args)
+            queries.append({"query": label, **explain_stats_query(cur, sql, params, indexes, analyze, table_rows)})
+    return {
+        "analyzed": analyze,
+        "generated_at": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+        "rollup_cutoff": stats_rollup.stats()["cutoff"],
+        "plans": stats_health_plan_source(plan_cache_mode),
+        "flagged": [query["query"] for query in queries if query["slow"] or query["seq_scans"]],
+        "suggested_indexes": sorted(
+            {scan["suggested_index"] for query in queries for scan in query["seq_scans"] if scan["suggested_index"]}
+        ),
+        "queries": queries,
+    }
+
+
+@app.cli.command("stats-health")
+@click.option("--dsn", default=None, help="Connect straight to this PostgreSQL DSN instead of through the SSH tunnel.")
+@click.option("--rollup/--no-rollup", default=True, show_default=True, help="Sync the daily rollups first and read closed days from them.")
+def stats_health(dsn, rollup):
+    """EXPLAIN ANALYZE every stats query shape and suggest indexes for large sequential scans."""
+    use_cli_database(dsn, rollup)
+    report = stats_query_health()
+    print(f"rollup cutoff: {report['rollup_cutoff']}")
+    print(f"plans: {report['plans']}")
+    print(f"{'query':<36} {'exec':>9} {'plan':>8}  sequential scans")
+    for query in report["queries"]:
+        scans = ", ".join(f"{scan['relation']} ({scan['rows_scanned']:,} rows)" for scan in query["seq_scans"])
+        marker = "  SLOW" if query["slow"] else ""
+        print(f"{query['query']:<36} {query['execution_ms']:7.2f}ms {query['planning_ms']:6.2f}ms  {scans or '-'}{marker}")
+    if report["suggested_indexes"]:
+        print("\nSuggested indexes:")
+        for statement in report["suggested_indexes"]:
+            print(f"  {statement};")
+    else:
+        print("\nNo large sequential scans.")
     
 def parse_date_filter(filter_type: str, start_date_str: str = None, end_date_str: str = None) -> Tuple[date, date]:
     today = date.today()
@@ -1020,25 +3206,22 @@ def logs():
         start_date = request.args.get("start_date")
         end_date = request.args.get("end_date")
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    if start_date and end_date:
-        cur.execute("""
-            SELECT to_char(timestamp, 'DD.MM.YYYY HH24:MI:SS') AS timestamp, username, action, regnumber, stocknumber, vstockno, location, status
-            FROM public.hpd3281
-            WHERE timestamp >= %s AND timestamp < %s
-            ORDER BY timestamp DESC
-        """, (start_date, end_date))
-    else:
-        cur.execute("""
-            SELECT to_char(timestamp, 'DD.MM.YYYY HH24:MI:SS') AS timestamp, username, action, regnumber, stocknumber, vstockno, location, status
-            FROM public.hpd3281
-            ORDER BY timestamp DESC
-            LIMIT 100
-        """)
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+    with db_cursor() as cur:
+        if start_date and end_date:
+            cur.execute("""
+                SELECT to_char(timestamp, 'DD.MM.YYYY HH24:MI:SS') AS timestamp, username, action, regnumber, stocknumber, vstockno, location, status
+                FROM public.hpd3281
+                WHERE timestamp >= %s AND timestamp < %s
+                ORDER BY timestamp DESC
+            """, (start_date, end_date))
+        else:
+            cur.execute("""
+                SELECT to_char(timestamp, 'DD.MM.YYYY HH24:MI:SS') AS timestamp, username, action, regnumber, stocknumber, vstockno, location, status
+                FROM public.hpd3281
+                ORDER BY timestamp DESC
+                LIMIT 100
+            """)
+        rows = cur.fetchall()
 
     return render_template("logs.html", logs=rows, filter_type=filter_type)
 
@@ -1091,6 +3274,181 @@ def normalize_stats_dimension(dimension: str) -> str:
     return "user" if str(dimension).lower() == "user" else "department"
 
 
+# Stats results are cached per (mode, dimension, date range). Ranges that include
+# today expire just before the next live refresh; closed ranges barely change.
+STATS_CACHE_MAX_ENTRIES = int(os.environ.get("STATS_CACHE_MAX_ENTRIES", "256"))
+STATS_CACHE_LIVE_TTL = float(os.environ.get("STATS_CACHE_LIVE_TTL", "4"))
+STATS_CACHE_CLOSED_TTL = float(os.environ.get("STATS_CACHE_CLOSED_TTL", "3600"))
+
+stats_cache = ResultCache(STATS_CACHE_MAX_ENTRIES)
+
+
+def stats_cache_ttl(end_date: date) -> Optional[float]:
+    """Short TTL for ranges that are still open, long (0 = never expire) for closed ones."""
+    if end_date > date.today():
+        return STATS_CACHE_LIVE_TTL
+    return STATS_CACHE_CLOSED_TTL or None
+
+
+# Incremental live stats. Open ranges keep running per-entity totals: the days
+# before the last full load are a base read through the stats builder (so
+# closed days come from the rollups), and only the days from then on are read
+# from the raw tables. Sales refreshes only aggregate those days' invoices past
+# the stored invoice_id high-water mark. sold has no monotonic id and solddate
+# may only be day-precise, so parts re-read those days at every refresh. A
+# periodic full resync picks up anything the high-water mark cannot see, such
+# as edited invoices or late-committing ids.
+STATS_INCREMENTAL = os.environ.get("STATS_INCREMENTAL", "1") != "0"
+STATS_INCREMENTAL_RESYNC = float(os.environ.get("STATS_INCREMENTAL_RESYNC", "300"))
+STATS_INCREMENTAL_MAX_RANGES = int(os.environ.get("STATS_INCREMENTAL_MAX_RANGES", "32"))
+
+
+class LiveStatsAggregator:
+    """Running per-entity totals for open date ranges, topped up from a high-water mark."""
+
+    def __init__(self, resync_after: float, max_ranges: int):
+        self.resync_after = resync_after
+        self.max_ranges = max_ranges
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = {"full_loads": 0, "incremental_refreshes": 0, "delta_rows": 0}
+
+    def _state(self, key) -> dict:
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                state = self._states[key] = {
+                    "lock": threading.Lock(),
+                    "totals": None,
+                    "high_water": None,
+                    "base_until": None,
+                    "synced_at": 0.0,
+                }
+            self._states.move_to_end(key)
+            while len(self._states) > self.max_ranges:
+                self._states.popitem(last=False)
+            return state
+
+    def rows(self, mode: str, dimension: str, start_date: date, end_date: date) -> Tuple[Tuple[str, float, float], ...]:
+        state = self._state((mode, dimension, start_date, end_date))
+
+        with state["lock"]:
+            now = time.monotonic()
+            full = state["totals"] is None or now - state["synced_at"] >= self.resync_after
+            if mode == "parts":
+                totals, delta_rows = self._parts_totals(state, dimension, start_date, end_date, full)
+            else:
+                totals, delta_rows = self._sales_totals(state, dimension, start_date, end_date, full)
+            if full:
+                state["synced_at"] = now
+
+            with self._lock:
+                self._metrics["full_loads" if full else "incremental_refreshes"] += 1
+                self._metrics["delta_rows"] += len(delta_rows)
+
+            rows = sorted(totals.items(), key=lambda item: (item[0] is None, item[0] or ""))
+
+        if mode == "parts":
+            return tuple((name, float(values[0]), float(values[1])) for name, values in rows)
+        return tuple((name, values[0], values[1]) for name, values in rows)
+
+    @staticmethod
+    def _add_rows(totals: dict, rows) -> dict:
+        for name, total, total_vat in rows:
+            # SUM over rows that are all NULL is NULL; count it as nothing sold.
+            total = total if total is not None else 0
+            total_vat = total_vat if total_vat is not None else 0
+            current = totals.get(name)
+            if current is None:
+                totals[name] = (total, total_vat)
+            else:
+                totals[name] = (current[0] + total, current[1] + total_vat)
+        return totals
+
+    def _sales_totals(self, state: dict, dimension: str, start_date: date, end_date: date, full: bool):
+        if full:
+            base_until = max(start_date, date.today())
+            fetch_rows = fetch_user_sales if dimension == "user" else fetch_department_sales
+            state["base_until"] = base_until
+            state["totals"] = self._add_rows({}, fetch_rows(start_date, base_until) if start_date < base_until else [])
+            state["high_water"] = None
+        base_until = state["base_until"]
+        if base_until >= end_date:
+            return state["totals"], []
+        delta_rows, delta_high_water = fetch_sales_delta(dimension, base_until, end_date, state["high_water"])
+        state["totals"] = self._add_rows(state["totals"], delta_rows)
+        if delta_high_water is not None:
+            state["high_water"] = delta_high_water
+        return state["totals"], delta_rows
+
+    def _parts_totals(self, state: dict, dimension: str, start_date: date, end_date: date, full: bool):
+        fetch_rows = fetch_user_parts_sold if dimension == "user" else fetch_department_parts_sold
+        if full:
+            base_until = max(start_date, date.today())
+            state["base_until"] = base_until
+            state["totals"] = self._add_rows({}, fetch_rows(start_date, base_until) if start_date < base_until else [])
+        base_until = state["base_until"]
+        # Everything from the base day on is re-read, so same-day rows are never skipped.
+        delta_rows = fetch_rows(base_until, end_date) if base_until < end_date else []
+        return self._add_rows(dict(state["totals"]), delta_rows), delta_rows
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"ranges": len(self._states), "max_ranges": self.max_ranges, **self._metrics}
+
+
+live_stats = LiveStatsAggregator(STATS_INCREMENTAL_RESYNC, STATS_INCREMENTAL_MAX_RANGES)
+
+
+def fetch_stats_rows(
+    mode: str, dimension: str, start_date: date, end_date: date, fresh: bool = False
+) -> List[Tuple[str, float, float]]:
+    if dimension == "department":
+        fetch_rows = fetch_department_parts_sold if mode == "parts" else fetch_department_sales
+    else:
+        fetch_rows = fetch_user_parts_sold if mode == "parts" else fetch_user_sales
+
+    def load():
+        if STATS_INCREMENTAL and start_date <= date.today() < end_date:
+            return live_stats.rows(mode, dimension, start_date, end_date)
+        return tuple(fetch_rows(start_date, end_date))
+
+    key = ("rows", mode, dimension, start_date, end_date)
+    if fresh:
+        rows = load()
+        stats_cache.put(key, rows, stats_cache_ttl(end_date))
+        return rows
+    return stats_cache.get_or_load(key, load, stats_cache_ttl(end_date))
+
+
+def load_stats_rows(
+    mode: str, dimension: str, start_date: date, end_date: date, fresh: bool = False
+) -> Tuple[tuple, tuple]:
+    """Return the (rows, prev_rows) pair behind a stats view for a resolved mode and dimension."""
+
+    if mode != "parts":
+        return fetch_stats_rows(mode, dimension, start_date, end_date, fresh=fresh), ()
+
+    prev_start = shift_one_month_back(start_date)
+    prev_end = shift_one_month_back(end_date)
+    if STATS_INCREMENTAL and start_date <= date.today() < end_date:
+        # The open range is topped up incrementally and the closed previous
+        # period is cached, so neither needs a full scan per refresh.
+        rows = fetch_stats_rows(mode, dimension, start_date, end_date, fresh=fresh)
+        return rows, fetch_stats_rows(mode, dimension, prev_start, prev_end)
+
+    def load():
+        rows, prev_rows = fetch_parts_sold_with_previous(dimension, start_date, end_date, prev_start, prev_end)
+        return tuple(rows), tuple(prev_rows)
+
+    key = ("parts_with_previous", dimension, start_date, end_date)
+    if fresh:
+        pair = load()
+        stats_cache.put(key, pair, stats_cache_ttl(end_date))
+        return pair
+    return stats_cache.get_or_load(key, load, stats_cache_ttl(end_date))
+
+
 def build_stats_context(
     filter_type: str,
     start_date_str: str,
@@ -1100,10 +3458,36 @@ def build_stats_context(
     dimension: str,
 ):
     start_date, end_date = parse_date_filter(filter_type, start_date_str, end_date_str)
-    date_range_label = describe_date_range(filter_type, start_date, end_date)
-
     resolved_mode = normalize_stats_mode(mode)
     resolved_dimension = normalize_stats_dimension(dimension)
+    rows, prev_rows = load_stats_rows(resolved_mode, resolved_dimension, start_date, end_date)
+
+    return assemble_stats_context(
+        filter_type,
+        start_date,
+        end_date,
+        rows,
+        prev_rows,
+        exclude_args,
+        resolved_mode,
+        resolved_dimension,
+        session.get("username"),
+    )
+
+
+def assemble_stats_context(
+    filter_type: str,
+    start_date: date,
+    end_date: date,
+    rows,
+    prev_rows,
+    exclude_args: List[str],
+    resolved_mode: str,
+    resolved_dimension: str,
+    current_user: Optional[str],
+):
+    date_range_label = describe_date_range(filter_type, start_date, end_date)
+
     mode_label = "Parts Sold" if resolved_mode == "parts" else "Sales"
     value_format = "count" if resolved_mode == "parts" else "currency"
     value_label = "Parts Sold" if resolved_mode == "parts" else "Sales Total"
@@ -1114,22 +3498,7 @@ def build_stats_context(
     entity_label = "Department" if resolved_dimension == "department" else "User"
     entity_label_plural = "Departments" if resolved_dimension == "department" else "Users"
 
-    if resolved_dimension == "department":
-        fetch_rows = fetch_department_parts_sold if resolved_mode == "parts" else fetch_department_sales
-        fetch_prev_rows = fetch_department_parts_sold
-    else:
-        fetch_rows = fetch_user_parts_sold if resolved_mode == "parts" else fetch_user_sales
-        fetch_prev_rows = fetch_user_parts_sold
-
-    rows = fetch_rows(start_date, end_date)
-    prev_rows = []
-    prev_row_map = {}
-    if resolved_mode == "parts":
-        prev_start = shift_one_month_back(start_date)
-        prev_end = shift_one_month_back(end_date)
-        prev_rows = fetch_prev_rows(prev_start, prev_end)
-        prev_row_map = {row[0]: float(row[1]) for row in prev_rows}
-    current_user = session.get("username")
+    prev_row_map = {row[0]: float(row[1]) for row in prev_rows}
     saved_order = load_department_order(current_user)
     order_index = {name: idx for idx, name in enumerate(saved_order)}
 
@@ -1217,23 +3586,208 @@ def stats_data():
         filter_type, start_date_str, end_date_str, excluded_args, mode, dimension
     )
 
-    return jsonify(
-        {
-            "date_range_label": context["date_range_label"],
-            "rows": [
-                {
-                    "department": row[0],
-                    "total": float(row[1]),
-                    "total_vat": float(row[2]),
-                }
-                for row in context["rows"]
-            ],
-            "sum_total": context["sum_total"],
-            "sum_total_vat": context["sum_total_vat"],
-            "chart_labels": context["chart_labels"],
-            "chart_values": context["chart_values"],
-        }
+    return jsonify(stats_data_payload(context))
+
+
+def stats_data_payload(context: dict) -> dict:
+    return {
+        "date_range_label": context["date_range_label"],
+        "rows": [
+            {
+                "department": row[0],
+                "total": float(row[1]),
+                "total_vat": float(row[2]),
+            }
+            for row in context["rows"]
+        ],
+        "sum_total": context["sum_total"],
+        "sum_total_vat": context["sum_total_vat"],
+        "chart_labels": context["chart_labels"],
+        "chart_values": context["chart_values"],
+    }
+
+
+# Live stats push. One refresh loop per worker reloads each distinct
+# (mode, dimension, date range) that has subscribers and only fans out rows
+# that changed, so DB load follows filter sets rather than open browsers.
+STATS_STREAM_INTERVAL = float(os.environ.get("STATS_STREAM_INTERVAL", "2"))
+STATS_STREAM_HEARTBEAT = float(os.environ.get("STATS_STREAM_HEARTBEAT", "15"))
+STATS_STREAM_MAX_SECONDS = float(os.environ.get("STATS_STREAM_MAX_SECONDS", "600"))
+# Each open stream holds one gthread request thread for up to
+# STATS_STREAM_MAX_SECONDS. Keep this below gunicorn's --threads (8 in
+# render.yaml) so logins and searches still get a thread; streams above the cap
+# get a 503 and the page falls back to polling /stats/data.
+STATS_STREAM_MAX_PER_WORKER = int(os.environ.get("STATS_STREAM_MAX_PER_WORKER", "4"))
+
+
+class StatsBroadcaster:
+    """Shared refresh loop that pushes changed stats rows to stream subscribers."""
+
+    def __init__(self, interval: float, max_streams: int):
+        self.interval = interval
+        self.max_streams = max_streams
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._streams = 0
+        self._thread = None
+        self._pid = None
+        self._metrics = {"refreshes": 0, "broadcasts": 0, "errors": 0, "rejected_streams": 0}
+
+    def open_stream(self) -> bool:
+        """Take one of this worker's stream slots, or return False when all are in use."""
+        with self._lock:
+            if self._streams >= self.max_streams:
+                self._metrics["rejected_streams"] += 1
+                return False
+            self._streams += 1
+            return True
+
+    def close_stream(self):
+        with self._lock:
+            self._streams -= 1
+
+    def _ensure_thread(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="stats-broadcaster", daemon=True)
+            self._thread.start()
+
+    @staticmethod
+    def _offer(subscription: queue.Queue, snapshot):
+        # A slow client only ever needs the newest snapshot.
+        try:
+            subscription.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            subscription.put_nowait(snapshot)
+        except queue.Full:
+            pass
+
+    def subscribe(self, key) -> queue.Queue:
+        subscription = queue.Queue(maxsize=1)
+        with self._lock:
+            channel = self._channels.setdefault(key, {"subscribers": set(), "snapshot": None})
+            channel["subscribers"].add(subscription)
+            snapshot = channel["snapshot"]
+        if snapshot is None:
+            try:
+                snapshot = load_stats_rows(*key)
+            except Exception:
+                # Otherwise the refresh loop keeps querying a key nobody listens to.
+                self.unsubscribe(key, subscription)
+                raise
+            with self._lock:
+                if key in self._channels and self._channels[key]["snapshot"] is None:
+                    self._channels[key]["snapshot"] = snapshot
+        self._offer(subscription, snapshot)
+        self._ensure_thread()
+        return subscription
+
+    def unsubscribe(self, key, subscription: queue.Queue):
+        with self._lock:
+            channel = self._channels.get(key)
+            if channel is None:
+                return
+            channel["subscribers"].discard(subscription)
+            if not channel["subscribers"]:
+                del self._channels[key]
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            with self._lock:
+                keys = list(self._channels)
+            for key in keys:
+                try:
+                    snapshot = load_stats_rows(*key, fresh=True)
+                except Exception as exc:
+                    with self._lock:
+                        self._metrics["errors"] += 1
+                    print(f"Stats stream refresh failed for {key}: {exc}")
+                    continue
+                with self._lock:
+                    self._metrics["refreshes"] += 1
+                    channel = self._channels.get(key)
+                    if channel is None or channel["snapshot"] == snapshot:
+                        continue
+                    channel["snapshot"] = snapshot
+                    subscribers = list(channel["subscribers"])
+                    self._metrics["broadcasts"] += 1
+                for subscription in subscribers:
+                    self._offer(subscription, snapshot)
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "streams": self._streams,
+                "max_streams": self.max_streams,
+                "channels": len(self._channels),
+                "subscribers": sum(len(channel["subscribers"]) for channel in self._channels.values()),
+                **self._metrics,
+            }
+
+
+stats_broadcaster = StatsBroadcaster(STATS_STREAM_INTERVAL, STATS_STREAM_MAX_PER_WORKER)
+
+
+@app.route("/stats/stream", methods=["GET"])
+def stats_stream():
+    filter_type = request.args.get("filter", "this_month")
+    start_date_str = request.args.get("start_date")
+    end_date_str = request.args.get("end_date")
+    excluded_args = request.args.getlist("exclude")
+    mode = normalize_stats_mode(request.args.get("mode", "sales"))
+    dimension = normalize_stats_dimension(request.args.get("dimension", "department"))
+    current_user = session.get("username")
+
+    start_date, end_date = parse_date_filter(filter_type, start_date_str, end_date_str)
+    key = (mode, dimension, start_date, end_date)
+    if not stats_broadcaster.open_stream():
+        return Response("Too many live streams, poll /stats/data instead.", status=503, headers={"Retry-After": "60"})
+
+    def generate():
+        last_payload = None
+        subscription = None
+        # Streams end periodically; EventSource reconnects and re-resolves
+        # relative filters such as "today" after midnight.
+        deadline = time.monotonic() + STATS_STREAM_MAX_SECONDS
+        try:
+            subscription = stats_broadcaster.subscribe(key)
+            yield f"retry: {int(STATS_STREAM_INTERVAL * 1000)}\n\n"
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    rows, prev_rows = subscription.get(timeout=min(STATS_STREAM_HEARTBEAT, remaining))
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                context = assemble_stats_context(
+                    filter_type, start_date, end_date, rows, prev_rows, excluded_args, mode, dimension, current_user
+                )
+                payload = json.dumps(stats_data_payload(context))
+                if payload != last_payload:
+                    last_payload = payload
+                    yield f"data: {payload}\n\n"
+        finally:
+            if subscription is not None:
+                stats_broadcaster.unsubscribe(key, subscription)
+
+    response = Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
+    # Runs when the server closes the response, even if the generator never started.
+    response.call_on_close(stats_broadcaster.close_stream)
+    return response
 
 
 @app.route("/stats/parts_breakdown", methods=["GET"])
@@ -1346,6 +3900,45 @@ def stats_department_daily(department):
 
     return jsonify({"labels": labels, "values": values, "year": current_year, "month": month})
 
+
+STATS_YEAR_MAX_AGE = int(os.environ.get("STATS_YEAR_MAX_AGE", "3600"))
+# Years before this have no data; anything outside the range is answered with a 400.
+STATS_FIRST_YEAR = int(os.environ.get("STATS_FIRST_YEAR", "2000"))
+
+
+@app.route("/stats/department/<path:department>/year", methods=["GET"])
+def stats_department_year(department):
+    """Every day of the year with data, so the page can build the monthly and daily charts itself."""
+    today = date.today()
+    try:
+        year = int(request.args.get("year", today.year))
+    except ValueError:
+        year = today.year
+    if not STATS_FIRST_YEAR <= year <= today.year + 1:
+        return jsonify({"error": f"Year must be between {STATS_FIRST_YEAR} and {today.year + 1}"}), 400
+    mode = normalize_stats_mode(request.args.get("mode", "sales"))
+    dimension = normalize_stats_dimension(request.args.get("dimension", "department"))
+    start_date = date(year, 1, 1)
+    end_date = date(year + 1, 1, 1)
+
+    rows = stats_cache.get_or_load(
+        ("year", mode, dimension, department, year),
+        lambda: tuple(fetch_daily_series(mode, dimension, department, start_date, end_date)),
+        stats_cache_ttl(end_date),
+    )
+    response = jsonify({"year": year, "days": [[day.isoformat(), float(value or 0)] for day, value in rows]})
+
+    # A closed year can be reused by the browser outright; the current one is
+    # revalidated against the ETag, which answers 304 while nothing changed.
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest())
+    response.cache_control.private = True
+    if end_date <= today:
+        response.cache_control.max_age = STATS_YEAR_MAX_AGE
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
 @app.route("/stats/exclusions", methods=["POST"])
 def save_stats_exclusions():
     filter_type = request.form.get("filter", "this_month")
@@ -1373,16 +3966,13 @@ def save_stats_exclusions():
     
 @app.route("/logs/download")
 def download_logs():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT to_char(timestamp, 'DD.MM.YYYY HH24:MI:SS') AS timestamp, username, action, regnumber, stocknumber, vstockno, location, status
-        FROM public.hpd3281
-        ORDER BY timestamp DESC
-    """)
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+    with db_cursor() as cur:
+        cur.execute("""
+            SELECT to_char(timestamp, 'DD.MM.YYYY HH24:MI:SS') AS timestamp, username, action, regnumber, stocknumber, vstockno, location, status
+            FROM public.hpd3281
+            ORDER BY timestamp DESC
+        """)
+        rows = cur.fetchall()
 
     import pandas as pd
     from io import BytesIO
@@ -1395,6 +3985,126 @@ def download_logs():
     return send_file(output, download_name="logs.xlsx", as_attachment=True)
 
 
+def read_smaps(pid: int, directory: Optional[str] = None) -> Optional[dict]:
+    """Memory of a process in kB from /proc (Linux only).
+
+    Without ``directory`` this is the whole process (smaps_rollup); with it,
+    only the file mappings under that directory are summed.
+    """
+    fields = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty')
+    totals = dict.fromkeys(fields, 0)
+    path = f"/proc/{pid}/smaps" if directory else f"/proc/{pid}/smaps_rollup"
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            counting = directory is None
+            for line in f:
+                key, _, rest = line.partition(':')
+                if directory and '-' in key:
+                    # A mapping header: "start-end perms offset dev inode [path]".
+                    parts = line.split(None, 5)
+                    counting = len(parts) == 6 and parts[5].strip().startswith(directory)
+                elif counting and key in totals:
+                    totals[key] += int(rest.split()[0])
+    except OSError:
+        return None
+    return totals
+
+
+def worker_pids() -> List[int]:
+    """This process and its sibling workers: processes with the same parent and command line."""
+    try:
+        with open('/proc/self/cmdline', 'rb') as f:
+            cmdline = f.read()
+        parent = os.getppid()
+        pids = []
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat", 'r', encoding='utf-8') as f:
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+                with open(f"/proc/{entry}/cmdline", 'rb') as f:
+                    same_command = f.read() == cmdline
+            except (OSError, ValueError, IndexError):
+                continue
+            if ppid == parent and same_command:
+                pids.append(int(entry))
+        return sorted(pids)
+    except OSError:
+        return [os.getpid()]
+
+
+def worker_memory_report() -> dict:
+    """Per-worker RSS/PSS, and how much of it is the shared, memory-mapped fleet dataset.
+
+    PSS splits each shared page between the processes mapping it, so the gap
+    between the summed fleet RSS and the summed fleet PSS is what separate
+    per-worker copies of the dataset would have cost on top.
+    """
+    snapshot = fleet_store.snapshot()
+    cache_dir = os.path.dirname(fleet_cache_path(fleet_store.path, snapshot.source_stamp)) + os.sep
+    workers = []
+    for pid in worker_pids():
+        process = read_smaps(pid)
+        if process is None:
+            continue
+        fleet = read_smaps(pid, cache_dir) or {}
+        workers.append({
+            "pid": pid,
+            "current": pid == os.getpid(),
+            "rss_mb": round(process['Rss'] / 1024, 1),
+            "pss_mb": round(process['Pss'] / 1024, 1),
+            "shared_mb": round((process['Shared_Clean'] + process['Shared_Dirty']) / 1024, 1),
+            "private_mb": round((process['Private_Clean'] + process['Private_Dirty']) / 1024, 1),
+            "fleet_rss_mb": round(fleet.get('Rss', 0) / 1024, 1),
+            "fleet_pss_mb": round(fleet.get('Pss', 0) / 1024, 1),
+        })
+    fleet_rss = sum(worker["fleet_rss_mb"] for worker in workers)
+    fleet_pss = sum(worker["fleet_pss_mb"] for worker in workers)
+    return {
+        "dataset_mb": round(snapshot.frame.memory_usage(index=False, deep=False).sum() / 2**20, 1),
+        "fleet_cache_dir": cache_dir,
+        "workers": workers,
+        "total_rss_mb": round(sum(worker["rss_mb"] for worker in workers), 1),
+        "total_pss_mb": round(sum(worker["pss_mb"] for worker in workers), 1),
+        "fleet_shared_saving_mb": round(fleet_rss - fleet_pss, 1),
+    }
+
+
+@app.route("/admin/metrics", methods=["GET"])
+def admin_metrics():
+    return jsonify(
+        {
+            "db_pool": db_pool.stats(),
+            "ssh_tunnel": tunnel_supervisor.stats(),
+            "stats_cache": stats_cache.stats(),
+            "ebay_cache": ebay_cache.stats(),
+            "ebay_upstream": ebay_breaker.stats(),
+            "live_stats": live_stats.stats(),
+            "stats_stream": stats_broadcaster.stats(),
+            "fleet_dataset": fleet_store.stats(),
+            "google_sheet": sheet_mirror.stats(),
+            "google_api": google_clients.stats(),
+            "index_search": index_fan_out.stats(),
+            "stats_rollup": stats_rollup.stats(),
+            "stats_queries": stats_queries.stats(),
+            "memory": worker_memory_report(),
+        }
+    )
+
+
+@app.route("/admin/stats_health", methods=["GET"])
+def admin_stats_health():
+    if not STATS_HEALTH_ROUTE:
+        return "Query health reports are turned off; run `flask stats-health` instead.", 404
+    report = stats_cache.get_or_load(
+        ("stats_health",), lambda: stats_query_health(analyze=False), STATS_HEALTH_ROUTE_TTL
+    )
+    return jsonify(report)
+
+
 
 if __name__ == '__main__':
+    if GOOGLE_WARMUP:
+        warm_up_google_sheet()
     app.run(debug=True, host='0.0.0.0')
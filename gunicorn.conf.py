@@ -0,0 +1,10 @@
+# Loaded automatically by gunicorn from the working directory.
+
+
+def post_worker_init(worker):
+    # Runs in each worker once the app is imported, so warm-up threads and
+    # sockets belong to the worker rather than a --preload master.
+    from app import GOOGLE_WARMUP, warm_up_google_sheet
+
+    if GOOGLE_WARMUP:
+        warm_up_google_sheet()